@@ -0,0 +1 @@
+"""Core recommendation engine for AniRecci, shared by the Streamlit app and offline tools."""
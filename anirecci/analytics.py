@@ -0,0 +1,138 @@
+"""Pre-aggregated dataset summaries for the EDA pages.
+
+Everything the EDA pages plot is computed once per dataset version (the
+source CSV's hash) and pickled under ``artifacts/analytics/``, so a checkbox
+toggle only draws figures from small arrays:
+
+* ``describe()``, dtypes and missing-value counts
+* genre/popularity/rating correlation matrix from the sparse genre matrix
+* binned histograms and binned Gaussian KDEs for numeric columns
+* top-N value counts and box-plot statistics for categorical columns
+* a popularity-stratified sample of numeric columns for pair plots
+"""
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from anirecci.catalog import file_hash, load_catalog, load_genre_matrix
+from anirecci.metrics import metrics
+
+DEFAULT_ANALYTICS_DIR = os.path.join('artifacts', 'analytics')
+# Bump when the summary contents change so stale pickles are recomputed.
+ANALYTICS_FORMAT = 1
+HISTOGRAM_BINS = 30
+KDE_GRID = 512
+TOP_CATEGORIES = 20
+PAIRPLOT_SAMPLE = 1000
+PAIRPLOT_STRATA = 10
+
+
+def binned_kde(values, grid_size=KDE_GRID):
+    """Gaussian KDE evaluated on a grid by convolving a fine histogram.
+
+    Uses Scott's rule for the bandwidth; cost is O(n + grid_size) rather than
+    O(n * grid_size).
+    """
+    values = values[np.isfinite(values)]
+    if len(values) < 2 or values.std() == 0:
+        return np.empty(0), np.empty(0)
+    bandwidth = 1.06 * values.std() * len(values) ** (-1 / 5)
+    low, high = values.min() - 3 * bandwidth, values.max() + 3 * bandwidth
+    counts, edges = np.histogram(values, bins=grid_size, range=(low, high))
+    step = edges[1] - edges[0]
+    half_width = min(grid_size // 2 - 1, int(np.ceil(4 * bandwidth / step)))
+    offsets = np.arange(-half_width, half_width + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    density = np.convolve(counts, kernel, mode='same')
+    density /= density.sum() * step
+    return (edges[:-1] + edges[1:]) / 2, density
+
+
+def stratified_sample(data, column, size=PAIRPLOT_SAMPLE, strata=PAIRPLOT_STRATA, seed=0):
+    """Up to ``size`` rows drawn evenly from ``strata`` quantile bins of ``column``."""
+    if len(data) <= size:
+        return data
+    bins = pd.qcut(data[column].rank(method='first'), strata, labels=False)
+    per_stratum = size // strata
+    return data.groupby(bins, group_keys=False).apply(
+        lambda group: group.sample(min(len(group), per_stratum), random_state=seed))
+
+
+def compute_summary(csv_path):
+    # Only needed on a cache miss; keeps matplotlib out of page start-up.
+    from matplotlib import cbook
+
+    data = load_catalog(csv_path)
+    data['genres'] = data['genres'].map(', '.join)
+    numeric = data.select_dtypes(include='number').columns.tolist()
+    categorical = [c for c in data.columns if c not in numeric]
+
+    summary = {
+        'columns': data.columns.tolist(),
+        'numeric_columns': numeric,
+        'categorical_columns': categorical,
+        'preview': data.head(),
+        'describe': data.describe(),
+        'dtypes': data.dtypes.astype(str),
+        'missing': data.isnull().sum(),
+        'histograms': {},
+        'kdes': {},
+        'value_counts': {},
+        'boxplots': {},
+    }
+
+    for column in numeric:
+        values = data[column].to_numpy(dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        summary['histograms'][column] = np.histogram(finite, bins=HISTOGRAM_BINS)
+        summary['kdes'][column] = binned_kde(finite)
+
+    for column in categorical:
+        counts = data[column].value_counts()
+        summary['value_counts'][column] = counts.head(TOP_CATEGORIES)
+        top = data[data[column].isin(counts.index[:TOP_CATEGORIES])]
+        summary['boxplots'][column] = {
+            value_column: [
+                {**cbook.boxplot_stats(group.dropna().to_numpy())[0], 'label': str(category)}
+                for category, group in top.groupby(column, sort=False)[value_column]
+                if group.notna().any()
+            ]
+            for value_column in numeric
+        }
+
+    if {'popularity', 'rating'} <= set(data.columns):
+        genre_matrix, genre_names = load_genre_matrix(csv_path)
+        features = pd.DataFrame(genre_matrix.toarray(), columns=genre_names, index=data.index)
+        features['popularity'] = data['popularity']
+        features['rating'] = data['rating'].fillna(data['rating'].median())
+        summary['correlation'] = features.corr()
+
+    stratify_by = 'popularity' if 'popularity' in numeric else numeric[0]
+    summary['pairplot_sample'] = stratified_sample(data[numeric], stratify_by)
+    return summary
+
+
+def load_summary(csv_path, analytics_dir=DEFAULT_ANALYTICS_DIR):
+    """Summary for the current version of ``csv_path``, computing and caching it on a miss."""
+    csv_hash = file_hash(csv_path)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    path = os.path.join(analytics_dir, f"{stem}-{csv_hash[:16]}-v{ANALYTICS_FORMAT}.pkl")
+    if os.path.exists(path):
+        metrics.incr('analytics_cache_hit')
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    metrics.incr('analytics_cache_miss')
+    with metrics.span('analytics'):
+        summary = compute_summary(csv_path)
+    os.makedirs(analytics_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(summary, f)
+    os.replace(tmp_path, path)
+    for name in os.listdir(analytics_dir):
+        if name.startswith(f"{stem}-") and name != os.path.basename(path):
+            os.remove(os.path.join(analytics_dir, name))
+    return summary
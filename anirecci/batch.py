@@ -0,0 +1,164 @@
+"""Offline batch recommendations and the precomputed neighbour table.
+
+Computes "similar hidden gems" for every title in the full catalog and
+writes them to a table the app can look up instead of scoring live:
+
+    $ python -m anirecci.batch --k 40 --workers 4
+
+With a live index (:mod:`anirecci.live_index`), pass ``--live-dir`` to score
+against its current snapshot. The table is only used while that generation
+is current, so rebuild it after each ``live_index update``.
+
+Seed sets are scored in chunks (one sparse matrix product per chunk, to bound
+memory) spread over a process pool; each worker loads the memory-mapped index
+once.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from anirecci.catalog import load_catalog
+from anirecci.index import DEFAULT_CSV, DEFAULT_INDEX_DIR, load_index, read_index
+from anirecci.live_index import DEFAULT_LIVE_DIR, current_snapshot
+from anirecci.recommender import Recommender
+
+DEFAULT_SOURCE_CSV = 'raw_anime_data_paged.csv'
+DEFAULT_TABLE_PATH = os.path.join('artifacts', 'neighbours.npz')
+CHUNK_SIZE = 256
+# Deep enough for diversification (anirecci.diversity) to pick 10 from.
+TABLE_K = 40
+
+_worker_recommender = None
+
+
+def _load(csv_path, index_dir, index_path=None):
+    # An explicit index directory (a live snapshot) wins over the CSV's index.
+    return read_index(index_path) if index_path else load_index(csv_path, index_dir)
+
+
+def _init_worker(csv_path, index_dir, index_path=None):
+    global _worker_recommender
+    _worker_recommender = Recommender(_load(csv_path, index_dir, index_path), backend='exact')
+
+
+def _score_chunk(seed_sets, k):
+    return _worker_recommender.recommend_batch(seed_sets, k)
+
+
+def batch_recommend(seed_sets, k, csv_path=DEFAULT_CSV, index_dir=DEFAULT_INDEX_DIR,
+                    chunk_size=CHUNK_SIZE, workers=None, recommender=None, index_path=None):
+    """Top-k ids and scores for every seed set, as ``(len(seed_sets), k)`` arrays.
+
+    With ``workers`` > 1 chunks are scored in a process pool; otherwise the
+    given (or a freshly loaded) ``recommender`` is used in-process. The index
+    is read from ``index_path`` if given, else built or loaded for ``csv_path``.
+    """
+    chunks = [seed_sets[i:i + chunk_size] for i in range(0, len(seed_sets), chunk_size)]
+    if not chunks:
+        return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float32)
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(csv_path, index_dir, index_path)) as executor:
+            results = list(executor.map(_score_chunk, chunks, [k] * len(chunks)))
+    else:
+        recommender = recommender or Recommender(_load(csv_path, index_dir, index_path), backend='exact')
+        results = [recommender.recommend_batch(chunk, k) for chunk in chunks]
+    return np.vstack([ids for ids, _ in results]), np.vstack([scores for _, scores in results])
+
+
+def catalog_seed_sets(source_csv=DEFAULT_SOURCE_CSV):
+    """One single-title seed set per catalog row, and the matching MAL ids."""
+    catalog = load_catalog(source_csv, columns=['id', 'description', 'genres'])
+    catalog['description'] = catalog['description'].fillna("")
+    seed_sets = [[{'id': int(anime_id), 'description': description, 'genres': list(genres)}]
+                 for anime_id, description, genres in catalog.itertuples(index=False)]
+    return seed_sets, catalog['id'].to_numpy(dtype=np.int64)
+
+
+class NeighbourTable:
+    """Precomputed top-k neighbours per MAL id, looked up with a binary search."""
+
+    def __init__(self, ids, neighbours, scores, csv_hash):
+        order = np.argsort(ids)
+        self.ids = ids[order]
+        self.neighbours = neighbours[order]
+        self.scores = scores[order]
+        self.csv_hash = csv_hash
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE_PATH):
+        with np.load(path) as arrays:
+            return cls(arrays['ids'], arrays['neighbours'], arrays['scores'], str(arrays['csv_hash']))
+
+    def save(self, path=DEFAULT_TABLE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, ids=self.ids, neighbours=self.neighbours, scores=self.scores,
+                 csv_hash=np.array(self.csv_hash))
+        os.replace(tmp_path, path)
+
+    def _row(self, anime_id):
+        i = np.searchsorted(self.ids, anime_id)
+        return i if i < len(self.ids) and self.ids[i] == anime_id else None
+
+    def __contains__(self, anime_id):
+        return self._row(anime_id) is not None
+
+    def recommend(self, seed_ids, k):
+        """Merged neighbours for ``seed_ids``, or ``None`` if any seed is missing.
+
+        Per-seed scores are summed, so titles close to several seeds rank
+        first. Seeds are never recommended back.
+        """
+        rows = [self._row(anime_id) for anime_id in seed_ids]
+        if not rows or k > self.k or any(row is None for row in rows):
+            return None
+        neighbours = self.neighbours[rows].ravel()
+        scores = np.nan_to_num(self.scores[rows].ravel())
+        keep = (neighbours >= 0) & ~np.isin(neighbours, seed_ids)
+        unique_ids, inverse = np.unique(neighbours[keep], return_inverse=True)
+        totals = np.bincount(inverse, weights=scores[keep], minlength=len(unique_ids))
+        order = np.argsort(-totals, kind='stable')[:k]
+        return unique_ids[order], totals[order]
+
+
+def build_table(source_csv=DEFAULT_SOURCE_CSV, csv_path=DEFAULT_CSV, index_dir=DEFAULT_INDEX_DIR,
+                k=TABLE_K, chunk_size=CHUNK_SIZE, workers=None, live_dir=None):
+    # Resolve the live snapshot once, so every worker scores the same generation.
+    index_path = current_snapshot(live_dir)[1] if live_dir else None
+    anime_index = _load(csv_path, index_dir, index_path)
+    seed_sets, ids = catalog_seed_sets(source_csv)
+    neighbours, scores = batch_recommend(seed_sets, k, csv_path, index_dir, chunk_size, workers,
+                                         index_path=index_path)
+    return NeighbourTable(ids, neighbours, scores, anime_index.csv_hash)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute hidden-gem neighbours for every catalog title.")
+    parser.add_argument('--source-csv', default=DEFAULT_SOURCE_CSV, help="titles to compute neighbours for")
+    parser.add_argument('--csv-path', default=DEFAULT_CSV, help="catalog the recommendations come from")
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--live-dir', nargs='?', const=DEFAULT_LIVE_DIR,
+                        help="score against the live index's current snapshot instead of --csv-path")
+    parser.add_argument('--output', default=DEFAULT_TABLE_PATH)
+    parser.add_argument('--k', type=int, default=TABLE_K)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    table = build_table(args.source_csv, args.csv_path, args.index_dir, args.k, args.chunk_size, args.workers,
+                        args.live_dir)
+    table.save(args.output)
+    print(f"Wrote neighbours for {len(table.ids)} titles to {args.output} in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Columnar catalog storage shared by the app and the EDA pages.
+
+The catalog CSVs store ``genres`` as Python list literals, which used to be
+re-parsed with ``eval``/``ast.literal_eval`` on every page load. Here each CSV
+is converted once into:
+
+* ``catalog.parquet`` - typed columns, with ``genres`` as a ``list<string>``
+* ``genres.npz`` / ``genre_names.json`` - a sparse multi-hot genre matrix
+
+Converted files live under ``artifacts/catalog/<csv-name>-<csv-hash>/`` and are
+regenerated automatically when the CSV changes.
+
+    $ python -m anirecci.catalog raw_anime_data_paged.csv less_popular_anime.csv
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy import sparse
+
+from anirecci.metrics import metrics
+
+DEFAULT_CATALOG_DIR = os.path.join('artifacts', 'catalog')
+CATALOG_FILE = 'catalog.parquet'
+
+
+def file_hash(path):
+    """SHA-256 of a file, read in chunks so large CSVs don't sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_genres(value):
+    """Parse a ``"['Action', 'Drama']"`` CSV cell without evaluating code."""
+    if pd.isna(value):
+        return []
+    return list(ast.literal_eval(value))
+
+
+def genre_matrix(genres):
+    """Multi-hot CSR matrix (rows x genres) and the sorted genre names."""
+    names = sorted({g for row in genres for g in row})
+    columns = {name: i for i, name in enumerate(names)}
+    indptr = np.zeros(len(genres) + 1, dtype=np.int64)
+    indices = []
+    for i, row in enumerate(genres):
+        cols = sorted({columns[g] for g in row})
+        indices.extend(cols)
+        indptr[i + 1] = indptr[i] + len(cols)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int8), np.asarray(indices, dtype=np.int32), indptr),
+        shape=(len(genres), len(names)),
+    )
+    return matrix, names
+
+
+def _version_dir(csv_path, catalog_dir, csv_hash):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(catalog_dir, f"{stem}-{csv_hash[:16]}")
+
+
+def convert(csv_path, catalog_dir=DEFAULT_CATALOG_DIR, csv_hash=None):
+    """Convert one catalog CSV to Parquet plus a genre matrix; returns the output directory."""
+    csv_hash = csv_hash or file_hash(csv_path)
+    target = _version_dir(csv_path, catalog_dir, csv_hash)
+    os.makedirs(catalog_dir, exist_ok=True)
+
+    with metrics.span('parse'):
+        anime_df = pd.read_csv(csv_path)
+        anime_df['genres'] = anime_df['genres'].apply(parse_genres)
+        matrix, names = genre_matrix(anime_df['genres'])
+
+    tmp_dir = tempfile.mkdtemp(prefix='.convert-', dir=catalog_dir)
+    try:
+        table = pa.Table.from_pandas(anime_df, preserve_index=False)
+        pq.write_table(table, os.path.join(tmp_dir, CATALOG_FILE), compression='zstd')
+        sparse.save_npz(os.path.join(tmp_dir, 'genres.npz'), matrix)
+        with open(os.path.join(tmp_dir, 'genre_names.json'), 'w') as f:
+            json.dump(names, f)
+        try:
+            os.rename(tmp_dir, target)
+        except OSError:
+            # Another process converted the same version first.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    prefix = os.path.basename(target).rsplit('-', 1)[0] + '-'
+    for name in os.listdir(catalog_dir):
+        if name.startswith(prefix) and name != os.path.basename(target):
+            shutil.rmtree(os.path.join(catalog_dir, name), ignore_errors=True)
+    return target
+
+
+def catalog_path(csv_path, catalog_dir=DEFAULT_CATALOG_DIR):
+    """Directory holding the converted catalog for ``csv_path``, converting it if needed."""
+    csv_hash = file_hash(csv_path)
+    path = _version_dir(csv_path, catalog_dir, csv_hash)
+    if not os.path.exists(os.path.join(path, CATALOG_FILE)):
+        metrics.incr('catalog_cache_miss')
+        path = convert(csv_path, catalog_dir, csv_hash=csv_hash)
+    else:
+        metrics.incr('catalog_cache_hit')
+    return path
+
+
+def load_catalog(csv_path, catalog_dir=DEFAULT_CATALOG_DIR, columns=None):
+    """Catalog frame for ``csv_path``; ``genres`` holds one array of names per row."""
+    with metrics.span('load'):
+        return pd.read_parquet(os.path.join(catalog_path(csv_path, catalog_dir), CATALOG_FILE), columns=columns)
+
+
+def load_genre_matrix(csv_path, catalog_dir=DEFAULT_CATALOG_DIR):
+    """Multi-hot genre matrix aligned with :func:`load_catalog` rows, and its column names."""
+    path = catalog_path(csv_path, catalog_dir)
+    with open(os.path.join(path, 'genre_names.json')) as f:
+        names = json.load(f)
+    return sparse.load_npz(os.path.join(path, 'genres.npz')), names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert catalog CSVs to the columnar format.")
+    parser.add_argument('csv_paths', nargs='*', default=['raw_anime_data_paged.csv', 'less_popular_anime.csv'])
+    parser.add_argument('--catalog-dir', default=DEFAULT_CATALOG_DIR)
+    args = parser.parse_args(argv)
+    for csv_path in args.csv_paths:
+        print(f"{csv_path} -> {convert(csv_path, args.catalog_dir)}")
+
+
+if __name__ == '__main__':
+    main()
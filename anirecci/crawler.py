@@ -0,0 +1,308 @@
+"""Incremental, resumable crawler for the Jikan anime catalog.
+
+Replaces ``fetch_anime_data_paged`` from anime_processing.ipynb. Pages are
+fetched in parallel through the rate-limited :class:`~anirecci.jikan.JikanClient`
+and upserted by ``mal_id`` into a local SQLite store. Every completed page is
+checkpointed, so an interrupted run (e.g. after exhausting 429 retries)
+resumes where it left off.
+
+    $ python -m anirecci.crawler --full     # refresh every page
+    $ python -m anirecci.crawler            # new titles + currently airing ones
+
+Both modes finish by exporting raw_anime_data_paged.csv and the popularity
+split in less_popular_anime.csv.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+
+from anirecci.catalog import load_catalog
+from anirecci.jikan import JikanClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.path.join('artifacts', 'catalog.sqlite3')
+DEFAULT_RAW_CSV = 'raw_anime_data_paged.csv'
+DEFAULT_LESS_POPULAR_CSV = 'less_popular_anime.csv'
+PAGE_SIZE = 25
+# Parallelism is bounded by the client's rate limiter, this only needs to be
+# large enough to hide per-request latency.
+MAX_WORKERS = 4
+COLUMNS = ['id', 'title', 'genres', 'popularity', 'rating', 'description', 'image_url']
+
+
+def anime_record(anime):
+    """Catalog row for a Jikan anime object, matching the CSV columns."""
+    return {
+        'id': anime.get('mal_id'),
+        'title': anime.get('title'),
+        'genres': [genre['name'] for genre in anime.get('genres', [])],
+        'popularity': anime.get('popularity'),
+        'rating': anime.get('score'),
+        'description': anime.get('synopsis'),
+        'image_url': anime.get('images', {}).get('jpg', {}).get('image_url'),
+    }
+
+
+class CatalogStore:
+    """SQLite table of anime rows keyed by ``mal_id``, plus crawl checkpoints."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS anime (
+                mal_id INTEGER PRIMARY KEY,
+                title TEXT,
+                genres TEXT,
+                popularity INTEGER,
+                rating REAL,
+                description TEXT,
+                image_url TEXT,
+                row_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS crawl_pages (
+                run TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                PRIMARY KEY (run, page)
+            );
+            CREATE TABLE IF NOT EXISTS crawl_runs (
+                run TEXT PRIMARY KEY,
+                last_page INTEGER,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            );
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def known_ids(self):
+        return {row[0] for row in self.conn.execute('SELECT mal_id FROM anime')}
+
+    def upsert(self, records):
+        """Insert new rows and update changed ones; returns the number of rows written."""
+        now = time.time()
+        rows = []
+        for record in records:
+            if record['id'] is None:
+                continue
+            genres = json.dumps(record['genres'])
+            values = (record['title'], genres, record['popularity'], record['rating'],
+                      record['description'], record['image_url'])
+            row_hash = hashlib.sha1(json.dumps(values).encode()).hexdigest()
+            rows.append((record['id'], *values, row_hash, now))
+        before = self.conn.total_changes
+        self.conn.executemany("""
+            INSERT INTO anime (mal_id, title, genres, popularity, rating, description, image_url, row_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(mal_id) DO UPDATE SET
+                title = excluded.title, genres = excluded.genres, popularity = excluded.popularity,
+                rating = excluded.rating, description = excluded.description, image_url = excluded.image_url,
+                row_hash = excluded.row_hash, updated_at = excluded.updated_at
+            WHERE anime.row_hash != excluded.row_hash
+        """, rows)
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def start_run(self, run, restart=False):
+        if restart:
+            self.conn.execute('DELETE FROM crawl_pages WHERE run = ?', (run,))
+            self.conn.execute('DELETE FROM crawl_runs WHERE run = ?', (run,))
+        self.conn.execute(
+            'INSERT OR IGNORE INTO crawl_runs (run, started_at) VALUES (?, ?)', (run, time.time()))
+        self.conn.commit()
+
+    def run_state(self, run):
+        """``(last_page, finished)`` for a checkpointed run."""
+        row = self.conn.execute(
+            'SELECT last_page, finished_at FROM crawl_runs WHERE run = ?', (run,)).fetchone()
+        return (row[0], row[1] is not None) if row else (None, False)
+
+    def set_last_page(self, run, last_page):
+        self.conn.execute('UPDATE crawl_runs SET last_page = ? WHERE run = ?', (last_page, run))
+        self.conn.commit()
+
+    def completed_pages(self, run):
+        return {row[0] for row in self.conn.execute('SELECT page FROM crawl_pages WHERE run = ?', (run,))}
+
+    def complete_page(self, run, page):
+        self.conn.execute('INSERT OR IGNORE INTO crawl_pages (run, page) VALUES (?, ?)', (run, page))
+        self.conn.commit()
+
+    def finish_run(self, run):
+        self.conn.execute('UPDATE crawl_runs SET finished_at = ? WHERE run = ?', (time.time(), run))
+        self.conn.commit()
+
+    def changed_since(self, watermark):
+        """Records inserted or changed after ``watermark`` and the new watermark."""
+        cursor = self.conn.execute(
+            'SELECT mal_id, title, genres, popularity, rating, description, image_url, updated_at '
+            'FROM anime WHERE updated_at > ? ORDER BY updated_at', (watermark,))
+        records = []
+        for *values, updated_at in cursor:
+            record = dict(zip(COLUMNS, values))
+            record['genres'] = json.loads(record['genres'])
+            records.append(record)
+            watermark = max(watermark, updated_at)
+        return records, watermark
+
+    def to_frame(self):
+        catalog = pd.read_sql_query(
+            'SELECT mal_id AS id, title, genres, popularity, rating, description, image_url '
+            'FROM anime ORDER BY mal_id', self.conn)
+        catalog['genres'] = catalog['genres'].apply(json.loads)
+        return catalog
+
+
+class Crawler:
+    def __init__(self, store, client=None, max_workers=MAX_WORKERS):
+        self.store = store
+        self.client = client or JikanClient(cache_path=None)
+        self.max_workers = max_workers
+
+    def fetch_page(self, page, params):
+        body = self.client.get('anime', params={**params, 'page': page, 'limit': PAGE_SIZE})
+        return body.get('data', []), body.get('pagination', {})
+
+    def crawl(self, run, params, restart=False):
+        """Fetch every page of ``/anime`` with ``params``, resuming ``run`` if it was interrupted.
+
+        Returns ``(changed, failed)``: the number of rows inserted or changed and
+        the pages that still failed after the client's retries. Failed pages are
+        left unchecked and picked up next time.
+        """
+        state_last_page, finished = self.store.run_state(run)
+        # A run that completed last time starts over rather than resuming.
+        restart = restart or finished
+        self.store.start_run(run, restart=restart)
+        done = self.store.completed_pages(run)
+        last_page = None if restart else state_last_page
+        changed = 0
+
+        if last_page is None:
+            data, pagination = self.fetch_page(1, params)
+            last_page = pagination.get('last_visible_page', 1)
+            self.store.set_last_page(run, last_page)
+            changed += self.store.upsert(anime_record(a) for a in data)
+            self.store.complete_page(run, 1)
+            done.add(1)
+
+        pending = [page for page in range(1, last_page + 1) if page not in done]
+        logger.info("%s: %d of %d pages to fetch", run, len(pending), last_page)
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch_page, page, params): page for page in pending}
+            for future in as_completed(futures):
+                page = futures[future]
+                try:
+                    data, _ = future.result()
+                except requests.RequestException as e:
+                    logger.error("Error fetching page %d: %s", page, e)
+                    failed.append(page)
+                    continue
+                changed += self.store.upsert(anime_record(a) for a in data)
+                self.store.complete_page(run, page)
+
+        if failed:
+            logger.warning("%s: %d pages failed; rerun to resume", run, len(failed))
+        else:
+            self.store.finish_run(run)
+        return changed, failed
+
+    def crawl_new(self):
+        """Fetch pages newest-first until a page contains no unseen ``mal_id``."""
+        known = self.store.known_ids()
+        changed, page = 0, 1
+        while True:
+            data, pagination = self.fetch_page(page, {'order_by': 'mal_id', 'sort': 'desc'})
+            records = [anime_record(a) for a in data]
+            changed += self.store.upsert(records)
+            if not pagination.get('has_next_page') or all(r['id'] in known for r in records):
+                return changed
+            page += 1
+
+
+def import_csv(store, csv_path):
+    """Seed an empty store from a previously exported raw catalog CSV."""
+    raw_df = load_catalog(csv_path)
+    raw_df['genres'] = raw_df['genres'].map(list)
+    raw_df = raw_df.astype(object).where(raw_df.notna(), None)
+    return store.upsert(raw_df.to_dict('records'))
+
+
+def split_less_popular(raw_df, quantile=0.5):
+    """Clean the raw catalog and keep titles less popular than the ``quantile`` rank.
+
+    Mirrors the preprocessing cell in anime_processing.ipynb.
+    """
+    anime_df = raw_df.drop_duplicates(subset='title', keep='first').copy()
+    anime_df['rating'] = anime_df['rating'].fillna(anime_df['rating'].mean())
+    anime_df['description'] = anime_df['description'].fillna("No description available.")
+    anime_df['genres'] = anime_df['genres'].apply(lambda genres: [g.lower() for g in genres])
+    anime_df['popularity'] = anime_df['popularity'].fillna(anime_df['popularity'].max())
+    threshold = anime_df['popularity'].quantile(quantile)
+    return anime_df[anime_df['popularity'] > threshold]
+
+
+def export(store, raw_csv=DEFAULT_RAW_CSV, less_popular_csv=DEFAULT_LESS_POPULAR_CSV):
+    """Write the raw catalog and the popularity split as CSV, replacing files atomically."""
+    raw_df = store.to_frame()[COLUMNS]
+    for frame, path in ((raw_df, raw_csv), (split_less_popular(raw_df), less_popular_csv)):
+        tmp_path = f"{path}.tmp"
+        frame.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return len(raw_df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl the Jikan anime catalog into a local store.")
+    parser.add_argument('--full', action='store_true', help="refresh every page instead of only new/airing titles")
+    parser.add_argument('--restart', action='store_true', help="ignore checkpoints from an interrupted run")
+    parser.add_argument('--export-only', action='store_true', help="skip crawling and just regenerate the CSVs")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH)
+    parser.add_argument('--raw-csv', default=DEFAULT_RAW_CSV)
+    parser.add_argument('--less-popular-csv', default=DEFAULT_LESS_POPULAR_CSV)
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    store = CatalogStore(args.store)
+    failed = []
+    try:
+        if not store.known_ids() and os.path.exists(args.raw_csv):
+            logger.info("Seeding empty store from %s", args.raw_csv)
+            import_csv(store, args.raw_csv)
+        if not args.export_only:
+            start_time = time.time()
+            crawler = Crawler(store, max_workers=args.workers)
+            if args.full:
+                changed, failed = crawler.crawl('full', {}, restart=args.restart)
+            else:
+                changed = crawler.crawl_new()
+                # Scores and popularity ranks mostly move while a show is airing.
+                airing_changed, failed = crawler.crawl('airing', {'status': 'airing'}, restart=args.restart)
+                changed += airing_changed
+            logger.info("%d rows inserted or updated in %.1f seconds", changed, time.time() - start_time)
+        total = export(store, args.raw_csv, args.less_popular_csv)
+        logger.info("Exported %d titles to %s and %s", total, args.raw_csv, args.less_popular_csv)
+    finally:
+        store.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
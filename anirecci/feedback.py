@@ -0,0 +1,259 @@
+"""Persistent recommendation feedback and the model folded from it.
+
+Votes are appended to a SQLite log by a background thread so the UI never
+waits on disk. A periodic fold (``python -m anirecci.feedback fold``, or the
+app's background thread) turns the log into a :class:`FeedbackModel`:
+
+* a per-title prior - the smoothed like ratio, centred on zero
+* item-item co-like counts - likes minus dislikes of a recommendation given
+  each seed, as a sparse matrix over the ids seen in feedback
+
+The recommender adds both as a vectorized re-ranking term.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+from anirecci.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_PATH = os.path.join('artifacts', 'feedback.sqlite3')
+DEFAULT_MODEL_PATH = os.path.join('artifacts', 'feedback_model.npz')
+FOLD_INTERVAL = 300
+# Beta prior on the like ratio, so a single vote doesn't swing a title to 0 or 1.
+PRIOR_LIKES = 1.0
+PRIOR_DISLIKES = 1.0
+
+
+def _connect(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS feedback ('
+        ' id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT, seed_ids TEXT NOT NULL,'
+        ' recommended_id INTEGER NOT NULL, vote INTEGER NOT NULL, ts REAL NOT NULL)'
+    )
+    return conn
+
+
+class FeedbackLog:
+    """Append-only vote log; :meth:`record` only enqueues, a daemon thread writes."""
+
+    def __init__(self, path=DEFAULT_LOG_PATH):
+        self.path = path
+        _connect(path).close()
+        self.pending = queue.SimpleQueue()
+        # Votes queued but not yet committed, for flush().
+        self.unwritten = 0
+        self.written = threading.Condition()
+        self.writer = threading.Thread(target=self._write_forever, name='anirecci-feedback-writer', daemon=True)
+        self.writer.start()
+
+    def record(self, seed_ids, votes, session=None):
+        """Queue a batch of ``{recommended_id: +1 | -1}`` votes for one seed set."""
+        now = time.time()
+        seeds = json.dumps(sorted(int(i) for i in seed_ids))
+        rows = [(session, seeds, int(rec_id), int(vote), now) for rec_id, vote in votes.items()]
+        with self.written:
+            self.unwritten += len(rows)
+        self.pending.put(rows)
+
+    def _write_forever(self):
+        conn = _connect(self.path)
+        while True:
+            rows = list(self.pending.get())
+            while not self.pending.empty():
+                rows.extend(self.pending.get_nowait())
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT INTO feedback (session, seed_ids, recommended_id, vote, ts) VALUES (?, ?, ?, ?, ?)',
+                        rows)
+                metrics.incr('feedback_votes', len(rows))
+            except sqlite3.Error as e:
+                logger.error("Error writing %d feedback rows: %s", len(rows), e)
+            with self.written:
+                self.unwritten -= len(rows)
+                self.written.notify_all()
+
+    def flush(self, timeout=5.0):
+        """Wait until queued votes have been committed (for tests and CLI use); ``False`` on timeout."""
+        with self.written:
+            return self.written.wait_for(lambda: self.unwritten == 0, timeout)
+
+
+def latest_votes(path=DEFAULT_LOG_PATH):
+    """Rows of ``(seed_ids, recommended_id, vote)``, keeping each session's last vote per pair."""
+    conn = _connect(path)
+    try:
+        return conn.execute("""
+            SELECT seed_ids, recommended_id, vote FROM feedback
+            WHERE id IN (
+                SELECT MAX(id) FROM feedback
+                GROUP BY COALESCE(session, id), seed_ids, recommended_id)
+        """).fetchall(), conn.execute('SELECT COALESCE(MAX(id), 0) FROM feedback').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def precision(path=DEFAULT_LOG_PATH):
+    """Share of stored votes that are likes, across every user, or ``None`` without votes.
+
+    This scans the whole log; the app shows :attr:`FeedbackModel.precision`
+    from the last fold instead.
+    """
+    rows, _ = latest_votes(path)
+    if not rows:
+        return None
+    return sum(vote > 0 for _, _, vote in rows) / len(rows)
+
+
+class FeedbackModel:
+    def __init__(self, ids, prior, co_like, version, precision=None):
+        self.ids = ids
+        self.prior = prior
+        self.co_like = co_like
+        self.version = int(version)
+        # Share of folded votes that are likes, or None without votes.
+        self.precision = precision
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32),
+                   sparse.csr_matrix((0, 0), dtype=np.float32), 0)
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        if not os.path.exists(path):
+            return cls.empty()
+        with np.load(path) as arrays:
+            co_like = sparse.csr_matrix(
+                (arrays['co_data'], arrays['co_indices'], arrays['co_indptr']), shape=tuple(arrays['co_shape']))
+            # Models folded before precision was stored have no such array.
+            value = float(arrays['precision']) if 'precision' in arrays.files else np.nan
+            return cls(arrays['ids'], arrays['prior'], co_like, arrays['version'],
+                       None if np.isnan(value) else value)
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, ids=self.ids, prior=self.prior, co_data=self.co_like.data,
+                 co_indices=self.co_like.indices, co_indptr=self.co_like.indptr,
+                 co_shape=np.array(self.co_like.shape), version=np.array(self.version),
+                 precision=np.array(np.nan if self.precision is None else self.precision))
+        os.replace(tmp_path, path)
+
+    def positions(self, anime_ids):
+        """Row of each id in this model, and a mask of which ids it knows."""
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.zeros(len(anime_ids), dtype=np.intp), np.zeros(len(anime_ids), dtype=bool)
+        rows = np.minimum(np.searchsorted(self.ids, anime_ids), len(self.ids) - 1)
+        return rows, self.ids[rows] == anime_ids
+
+    def scores(self, seed_ids, candidate_ids):
+        """Re-ranking term for ``candidate_ids`` given ``seed_ids``.
+
+        The prior plus the squashed co-like count from the seeds; both are
+        roughly in ``[-1, 1]``.
+        """
+        rows, known = self.positions(candidate_ids)
+        result = np.where(known, self.prior[rows], 0).astype(np.float32)
+        seed_rows, seed_known = self.positions(seed_ids)
+        if seed_known.any():
+            co_like = np.asarray(self.co_like[seed_rows[seed_known]].sum(axis=0)).ravel()
+            result += np.where(known, np.tanh(co_like[rows] / 3), 0)
+        return result
+
+
+def fold(log_path=DEFAULT_LOG_PATH):
+    """Build a :class:`FeedbackModel` from every stored vote."""
+    rows, version = latest_votes(log_path)
+    if not rows:
+        return FeedbackModel.empty()
+    seeds = [json.loads(seed_ids) for seed_ids, _, _ in rows]
+    recommended = np.array([rec_id for _, rec_id, _ in rows], dtype=np.int64)
+    votes = np.array([vote for _, _, vote in rows], dtype=np.float32)
+
+    ids = np.unique(np.concatenate([recommended, np.array([i for s in seeds for i in s], dtype=np.int64)]))
+    rec_rows = np.searchsorted(ids, recommended)
+    likes = np.bincount(rec_rows, weights=votes > 0, minlength=len(ids))
+    dislikes = np.bincount(rec_rows, weights=votes < 0, minlength=len(ids))
+    prior = (likes + PRIOR_LIKES) / (likes + dislikes + PRIOR_LIKES + PRIOR_DISLIKES) - 0.5
+
+    seed_rows = np.searchsorted(ids, np.array([i for s in seeds for i in s], dtype=np.int64))
+    pair_cols = np.repeat(rec_rows, [len(s) for s in seeds])
+    pair_votes = np.repeat(votes, [len(s) for s in seeds])
+    co_like = sparse.csr_matrix((pair_votes, (seed_rows, pair_cols)), shape=(len(ids), len(ids)), dtype=np.float32)
+    co_like.sum_duplicates()
+    return FeedbackModel(ids, prior.astype(np.float32), co_like, version, float((votes > 0).mean()))
+
+
+def fold_and_save(log_path=DEFAULT_LOG_PATH, model_path=DEFAULT_MODEL_PATH):
+    with metrics.span('feedback_fold'):
+        model = fold(log_path)
+        model.save(model_path)
+    return model
+
+
+def fold_if_changed(log_path=DEFAULT_LOG_PATH, model_path=DEFAULT_MODEL_PATH):
+    """Refold and save only if votes were logged since the saved model; returns the new model or ``None``."""
+    conn = _connect(log_path)
+    try:
+        log_version = conn.execute('SELECT COALESCE(MAX(id), 0) FROM feedback').fetchone()[0]
+    finally:
+        conn.close()
+    model_version = 0
+    if os.path.exists(model_path):
+        # Only the small version array is read from the archive.
+        with np.load(model_path) as arrays:
+            model_version = int(arrays['version'])
+    if log_version == model_version:
+        return None
+    return fold_and_save(log_path, model_path)
+
+
+def start_periodic_fold(interval=FOLD_INTERVAL, log_path=DEFAULT_LOG_PATH, model_path=DEFAULT_MODEL_PATH):
+    """Refold the model every ``interval`` seconds on a daemon thread, when there are new votes."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                fold_if_changed(log_path, model_path)
+            except (sqlite3.Error, OSError) as e:
+                logger.error("Error folding feedback: %s", e)
+
+    thread = threading.Thread(target=run, name='anirecci-feedback-fold', daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fold stored feedback into the re-ranking model.")
+    parser.add_argument('command', choices=['fold', 'stats'])
+    parser.add_argument('--log', default=DEFAULT_LOG_PATH)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == 'fold':
+        model = fold_and_save(args.log, args.model)
+        print(f"Folded feedback up to row {model.version}: {len(model.ids)} titles, "
+              f"{model.co_like.nnz} co-like pairs")
+    else:
+        rows, _ = latest_votes(args.log)
+        value = precision(args.log)
+        print(f"{len(rows)} votes, precision@k {value:.2%}" if value is not None else "No feedback yet")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""Prebuilt TF-IDF index for the recommender.
+
+The index is fitted offline and written to disk so the Streamlit app only has
+to load it once per process instead of refitting on every rerun:
+
+    $ python -m anirecci.index less_popular_anime.csv
+
+Each build lives in its own directory named after the SHA-256 of the source
+CSV, so editing the data automatically triggers a rebuild on the next load.
+
+Everything a worker needs is stored as flat, uncompressed arrays (``.npy``
+CSR components and an Arrow IPC catalog) and memory-mapped read-only, so
+every app process on a host shares one copy through the page cache. A build
+is made visible by bumping the generation counter in ``CURRENT.json``;
+workers compare generations and swap to the new directory atomically.
+
+Every build also stores the item-similarity graph used for diversification
+(see :mod:`anirecci.diversity`), so it never has to be computed on a request.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from anirecci.catalog import DEFAULT_CATALOG_DIR, file_hash, genre_matrix, load_catalog
+from anirecci.diversity import build_graph
+from anirecci.metrics import metrics
+
+DEFAULT_CSV = 'less_popular_anime.csv'
+DEFAULT_INDEX_DIR = os.path.join('artifacts', 'index')
+MANIFEST = 'manifest.json'
+CURRENT = 'CURRENT.json'
+# Bump when the on-disk layout changes so stale builds are ignored.
+INDEX_FORMAT = 5
+
+
+class AnimeIndex:
+    """Fitted vectorizer, CSR description and genre matrices and parsed catalog for one CSV version.
+
+    ``candidate_mask`` optionally fixes which rows are recommendation
+    candidates; by default the Recommender derives them from popularity.
+    ``similarity_graph`` holds each row's nearest rows by description, or is
+    ``None`` for indexes written without one.
+    """
+
+    def __init__(self, catalog, vectorizer, matrix, genre_matrix, genre_names, csv_hash, path,
+                 candidate_mask=None, similarity_graph=None):
+        self.catalog = catalog
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.genre_matrix = genre_matrix
+        self.genre_names = genre_names
+        self.csv_hash = csv_hash
+        self.path = path
+        self.candidate_mask = candidate_mask
+        self.similarity_graph = similarity_graph
+
+    def __len__(self):
+        return len(self.catalog)
+
+
+def prepare_catalog(csv_path, catalog_dir=DEFAULT_CATALOG_DIR):
+    """Load the columnar catalog and normalise it the way the recommender expects."""
+    anime_df = load_catalog(csv_path, catalog_dir)
+    anime_df['description'] = anime_df['description'].fillna("No description available.")
+    anime_df['genres'] = anime_df['genres'].map(lambda genres: [g.lower() for g in genres])
+    return anime_df
+
+
+def _version_dir(index_dir, csv_hash):
+    return os.path.join(index_dir, f"{csv_hash[:16]}-v{INDEX_FORMAT}")
+
+
+def _save_csr(path, prefix, matrix):
+    np.save(os.path.join(path, f"{prefix}data.npy"), matrix.data)
+    np.save(os.path.join(path, f"{prefix}indices.npy"), matrix.indices)
+    np.save(os.path.join(path, f"{prefix}indptr.npy"), matrix.indptr)
+
+
+def _load_csr(path, prefix, shape, mmap=True):
+    mmap_mode = 'r' if mmap else None
+    return sparse.csr_matrix(
+        tuple(np.load(os.path.join(path, f"{prefix}{part}.npy"), mmap_mode=mmap_mode)
+              for part in ('data', 'indices', 'indptr')),
+        shape=tuple(shape),
+        copy=False,
+    )
+
+
+def write_index(path, catalog, vectorizer, matrix, genres, genre_names, csv_hash, candidate_mask=None, **manifest):
+    """Write an index directory to ``path`` atomically; a concurrent writer of the same path wins."""
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    # Write into a scratch directory and rename it into place, so concurrent
+    # readers never see a half-written index.
+    tmp_dir = tempfile.mkdtemp(prefix='.build-', dir=parent)
+    try:
+        _save_csr(tmp_dir, '', matrix)
+        np.save(os.path.join(tmp_dir, 'idf.npy'), np.asarray(vectorizer.idf_, dtype=np.float32))
+        with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w') as f:
+            json.dump({term: int(col) for term, col in vectorizer.vocabulary_.items()}, f)
+        _save_csr(tmp_dir, 'genres_', genres)
+        with open(os.path.join(tmp_dir, 'genre_names.json'), 'w') as f:
+            json.dump(genre_names, f)
+        if candidate_mask is not None:
+            np.save(os.path.join(tmp_dir, 'candidate_mask.npy'), np.asarray(candidate_mask, dtype=bool))
+        with metrics.span('similarity_graph', rows=matrix.shape[0]):
+            graph = build_graph(matrix)
+        _save_csr(tmp_dir, 'graph_', graph)
+        # Uncompressed Arrow IPC, so the catalog can be memory-mapped too
+        feather.write_feather(catalog.reset_index(drop=True), os.path.join(tmp_dir, 'catalog.arrow'),
+                              compression='uncompressed')
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump({
+                **manifest,
+                'csv_hash': csv_hash,
+                'shape': list(matrix.shape),
+                'genres_shape': list(genres.shape),
+                'graph_shape': list(graph.shape),
+                'built_at': time.time(),
+            }, f)
+        try:
+            os.rename(tmp_dir, path)
+        except OSError:
+            # Another process published the same version first.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return path
+
+
+def build_index(csv_path=DEFAULT_CSV, index_dir=DEFAULT_INDEX_DIR, csv_hash=None, catalog_dir=DEFAULT_CATALOG_DIR):
+    """Fit TF-IDF over the catalog descriptions, write the index to disk and publish it.
+
+    Returns the directory the index was written to.
+    """
+    csv_hash = csv_hash or file_hash(csv_path)
+    anime_df = prepare_catalog(csv_path, catalog_dir)
+    with metrics.span('vectorize', phase='fit'):
+        vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32)
+        matrix = vectorizer.fit_transform(anime_df['description']).tocsr()
+        genres, genre_names = genre_matrix(anime_df['genres'])
+
+    target = write_index(_version_dir(index_dir, csv_hash), anime_df, vectorizer, matrix, genres, genre_names,
+                         csv_hash, csv_path=os.path.abspath(csv_path))
+    publish(index_dir, target)
+    _prune_old_versions(index_dir, keep=os.path.basename(target))
+    return target
+
+
+def _prune_old_versions(index_dir, keep):
+    # Workers still attached to an older version keep their mappings; the
+    # files are only released once the last one swaps.
+    for name in os.listdir(index_dir):
+        if name != keep and not name.startswith('.') and name != CURRENT:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+
+def current_generation(index_dir=DEFAULT_INDEX_DIR):
+    """``(generation, path)`` of the published index, or ``(0, None)`` before the first publish."""
+    try:
+        with open(os.path.join(index_dir, CURRENT)) as f:
+            current = json.load(f)
+    except FileNotFoundError:
+        return 0, None
+    return current['generation'], os.path.join(index_dir, current['path'])
+
+
+def publish(index_dir, path):
+    """Point ``CURRENT.json`` at ``path`` under the next generation number; returns the generation."""
+    generation, current = current_generation(index_dir)
+    if current is not None and os.path.samefile(current, path):
+        return generation
+    tmp_path = os.path.join(index_dir, f".{CURRENT}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({'generation': generation + 1, 'path': os.path.basename(path), 'published_at': time.time()}, f)
+    os.replace(tmp_path, os.path.join(index_dir, CURRENT))
+    return generation + 1
+
+
+def read_catalog(path, mmap=True):
+    """The Arrow catalog of an index; memory-mapped, Arrow-backed columns unless ``mmap`` is false."""
+    if not mmap:
+        return feather.read_feather(path)
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_index(path, mmap=True):
+    """Load an index directory written by :func:`write_index`."""
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    matrix = _load_csr(path, '', manifest['shape'], mmap=mmap)
+    with open(os.path.join(path, 'vocabulary.json')) as f:
+        vocabulary = json.load(f)
+    vectorizer = TfidfVectorizer(stop_words='english', vocabulary=vocabulary, dtype=np.float32)
+    vectorizer.idf_ = np.load(os.path.join(path, 'idf.npy'))
+    with open(os.path.join(path, 'genre_names.json')) as f:
+        genre_names = json.load(f)
+    genres = _load_csr(path, 'genres_', manifest['genres_shape'], mmap=mmap)
+    catalog = read_catalog(os.path.join(path, 'catalog.arrow'), mmap=mmap)
+    mask_path = os.path.join(path, 'candidate_mask.npy')
+    candidate_mask = np.load(mask_path) if os.path.exists(mask_path) else None
+    graph = _load_csr(path, 'graph_', manifest['graph_shape'], mmap=mmap) if 'graph_shape' in manifest else None
+    return AnimeIndex(catalog, vectorizer, matrix, genres, genre_names, manifest['csv_hash'], path,
+                      candidate_mask=candidate_mask, similarity_graph=graph)
+
+
+def published_arrays(path, build):
+    """Named arrays stored as ``.npy`` files in ``path`` and memory-mapped read-only.
+
+    The first caller builds them with ``build()`` (a dict of arrays) and
+    publishes them atomically; everyone else attaches to the same files.
+    """
+    if not os.path.exists(path):
+        arrays = build()
+        tmp_dir = tempfile.mkdtemp(prefix='.arrays-', dir=os.path.dirname(path))
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        try:
+            os.rename(tmp_dir, path)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r')
+            for name in os.listdir(path) if name.endswith('.npy')}
+
+
+def load_index(csv_path=DEFAULT_CSV, index_dir=DEFAULT_INDEX_DIR, mmap=True):
+    """Load the index for ``csv_path``, building (and publishing) it first if the CSV has changed.
+
+    An existing index is read as is; only :func:`build_index` moves ``CURRENT.json``.
+    """
+    with metrics.span('load'):
+        csv_hash = file_hash(csv_path)
+        path = _version_dir(index_dir, csv_hash)
+        if not os.path.exists(os.path.join(path, MANIFEST)):
+            metrics.incr('index_cache_miss')
+            path = build_index(csv_path, index_dir, csv_hash=csv_hash)
+        else:
+            metrics.incr('index_cache_hit')
+        return read_index(path, mmap=mmap)
+
+
+def current_index(csv_path=DEFAULT_CSV, index_dir=DEFAULT_INDEX_DIR, mmap=True):
+    """Load the published index, which serving workers attach to.
+
+    ``csv_path`` is built and published first when nothing is published yet,
+    or when its contents changed after the published index was built. The
+    CSV is only hashed when its mtime is newer than the build.
+    """
+    with metrics.span('load'):
+        _, path = current_generation(index_dir)
+        stale = path is None
+        if not stale:
+            with open(os.path.join(path, MANIFEST)) as f:
+                manifest = json.load(f)
+            stale = (os.path.getmtime(csv_path) > manifest['built_at']
+                     and file_hash(csv_path) != manifest['csv_hash'])
+        if stale:
+            metrics.incr('index_cache_miss')
+            path = build_index(csv_path, index_dir)
+        else:
+            metrics.incr('index_cache_hit')
+        return read_index(path, mmap=mmap)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the AniRecci TF-IDF index.")
+    parser.add_argument('csv_path', nargs='?', default=DEFAULT_CSV)
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    path = build_index(args.csv_path, args.index_dir)
+    print(f"Index written to {path} in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""Rate-limited, cached client for the Jikan (MyAnimeList) API.
+
+All requests go through one pooled ``requests.Session`` and a token bucket
+matching Jikan's published limits (3 requests/second, 60 requests/minute).
+429 and 5xx responses are retried with exponential backoff, honouring
+``Retry-After`` when the server sends it. Search results are cached in SQLite
+keyed by the normalised query, so the cache is shared by every session and
+survives restarts.
+"""
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from anirecci.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = 'https://api.jikan.moe/v4'
+DEFAULT_CACHE_PATH = os.path.join('artifacts', 'jikan_cache.sqlite3')
+CACHE_TTL = 7 * 24 * 3600
+# Misses are cached briefly so a typo doesn't hammer the API, but a newly
+# listed title shows up soon after.
+MISS_TTL = 3600
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Share of cache writes that also delete expired rows, so the file stays bounded
+# in long-running processes.
+PURGE_PROBABILITY = 0.01
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` requests per ``per`` seconds."""
+
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.fill_rate = rate / per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Blocks until every bucket has a token available."""
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets or [TokenBucket(3, 1.0), TokenBucket(60, 60.0)]
+
+    def acquire(self):
+        for bucket in self.buckets:
+            bucket.acquire()
+
+
+class ResponseCache:
+    """SQLite-backed TTL cache of JSON values.
+
+    A connection is opened per call so the cache can be used from worker
+    threads and from several processes at once.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+        self.purge_expired()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        """Return ``(hit, value)``; ``value`` may legitimately be ``None`` for a cached miss."""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value FROM responses WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + ttl),
+            )
+        if random.random() < PURGE_PROBABILITY:
+            self.purge_expired()
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM responses WHERE expires_at <= ?', (time.time(),))
+
+
+def normalize_query(title):
+    """Case- and whitespace-insensitive cache key for a search title."""
+    return re.sub(r'\s+', ' ', title).strip().casefold()
+
+
+def parse_anime(anime):
+    """Convert a Jikan anime object into the dict shape used by the recommender."""
+    return {
+        'id': anime.get('mal_id'),
+        'title': anime.get('title'),
+        'genres': [genre['name'] for genre in anime.get('genres', [])],
+        'description': anime.get('synopsis') or "",
+        'rating': anime.get('score') or 0,
+        'image_url': anime.get('images', {}).get('jpg', {}).get('image_url'),
+    }
+
+
+class JikanClient:
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, base_url=BASE_URL, max_workers=8,
+                 max_retries=3, timeout=10, rate_limiter=None):
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, path, params=None):
+        """GET ``path`` and return the decoded JSON body, retrying 429/5xx responses.
+
+        Raises ``requests.HTTPError`` once retries are exhausted or for other
+        error statuses.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                metrics.incr(f"jikan_http_{response.status_code}")
+                delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                logger.warning("Jikan %s for %s, retrying in %.1fs", response.status_code, url, delay)
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    @staticmethod
+    def _backoff(attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(30.0, 2 ** attempt) + random.uniform(0, 0.5)
+
+    def search_anime(self, title):
+        """Best match for ``title`` as a recommender dict, or ``None``."""
+        key = f"search:{normalize_query(title)}"
+        if self.cache is not None:
+            hit, value = self.cache.get(key)
+            metrics.incr('jikan_cache_hit' if hit else 'jikan_cache_miss')
+            if hit:
+                return value
+
+        try:
+            with metrics.span('fetch', source='jikan'):
+                data = self.get('anime', params={'q': title, 'limit': 1}).get('data', [])
+        except requests.RequestException as e:
+            # Don't cache failures, only genuine "no such title" answers.
+            logger.error("Error fetching details for '%s': %s", title, e)
+            return None
+
+        result = parse_anime(data[0]) if data else None
+        if self.cache is not None:
+            self.cache.set(key, result, CACHE_TTL if result else MISS_TTL)
+        return result
+
+    def search_many(self, titles):
+        """Look up several titles concurrently; results keep the input order."""
+        if not titles:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(titles))) as executor:
+            return list(executor.map(self.search_anime, titles))
@@ -0,0 +1,384 @@
+"""Live TF-IDF index that takes new and changed titles without a full rebuild.
+
+:mod:`anirecci.index` refits the vectorizer over the whole corpus whenever the
+CSV changes. The live index keeps the vocabulary of its last full fit and only
+vectorizes the rows that actually changed:
+
+* raw term counts are stored rather than TF-IDF weights, and document
+  frequencies are kept up to date, so the IDF can be refreshed without
+  re-tokenizing anything;
+* rows live in immutable, append-only segments keyed by ``mal_id``; an updated
+  title gets a new row and its old row is tombstoned, a removed title is only
+  tombstoned;
+* the candidate tier is recomputed from the live popularity column on every
+  update instead of at app start.
+
+    $ python -m anirecci.live_index init raw_anime_data_paged.csv
+    $ python -m anirecci.live_index update      # rows the crawler changed since the last update
+    $ python -m anirecci.live_index compact     # fold segments and tombstones into one base segment
+
+Everything lives under ``artifacts/live_index/``. Each commit also writes a
+regular index directory for the app to memory-map (``snapshots/<generation>``)
+and then replaces ``manifest.json`` atomically, so a reader always opens a
+consistent generation. Words that were not in the
+vocabulary at ``init`` are ignored until the next ``init``.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from anirecci.catalog import genre_matrix, load_catalog
+from anirecci.crawler import COLUMNS, DEFAULT_RAW_CSV, DEFAULT_STORE_PATH, CatalogStore
+from anirecci.index import read_index, write_index
+from anirecci.metrics import metrics
+
+DEFAULT_LIVE_DIR = os.path.join('artifacts', 'live_index')
+MANIFEST = 'manifest.json'
+VOCABULARY = 'vocabulary.json'
+# less_popular_anime.csv keeps titles ranked below the median of the raw
+# catalog and the Recommender takes the median of that again, so over the full
+# catalog the app's candidates are roughly the titles past the 0.75 quantile.
+TIER_QUANTILE = 0.75
+# Refresh the IDF once the number of live rows drifts this far from the last refresh.
+IDF_REFRESH_DRIFT = 0.1
+
+
+def smooth_idf(df, n_docs):
+    """IDF with the same smoothing as ``TfidfVectorizer(smooth_idf=True)``."""
+    return (np.log((1 + n_docs) / (1 + np.asarray(df, dtype=np.float64))) + 1).astype(np.float32)
+
+
+def _optional_float(value):
+    return None if value is None or pd.isna(value) else float(value)
+
+
+def prepare_records(records):
+    """Catalog frame for crawler-style records, normalised like :func:`anirecci.index.prepare_catalog`.
+
+    Adds a ``row_hash`` column so unchanged rows can be skipped on update.
+    """
+    frame = pd.DataFrame(list(records), columns=COLUMNS)
+    frame['id'] = frame['id'].astype(np.int64)
+    frame['genres'] = frame['genres'].map(lambda genres: [g.lower() for g in genres] if genres is not None else [])
+    frame['description'] = frame['description'].fillna("No description available.")
+    for column in ('title', 'image_url'):
+        frame[column] = frame[column].astype(object).where(frame[column].notna(), None)
+    frame['popularity'] = frame['popularity'].map(_optional_float).astype(np.float64)
+    frame['rating'] = frame['rating'].map(_optional_float).astype(np.float64)
+    frame['row_hash'] = [
+        hashlib.sha1(json.dumps([
+            row.title, row.genres, _optional_float(row.popularity), _optional_float(row.rating),
+            row.description, row.image_url,
+        ]).encode()).hexdigest()
+        for row in frame.itertuples(index=False)
+    ]
+    return frame
+
+
+class LiveIndex:
+    """Segmented term-count store with tombstones, document frequencies and a popularity tier.
+
+    Row ``i`` of ``tf`` lines up with row ``i`` of ``catalog``; ``alive`` masks
+    out tombstoned rows and ``rows`` maps each live ``mal_id`` to its row.
+    Changes stay in memory until :meth:`commit`.
+    """
+
+    def __init__(self, path, vocabulary, segments, alive, df, idf, manifest):
+        self.path = path
+        self.vocabulary = vocabulary
+        self.counter = CountVectorizer(stop_words='english', vocabulary=vocabulary, dtype=np.float32)
+        self.tf = sparse.vstack([tf for tf, _ in segments], format='csr', dtype=np.float32)
+        self.catalog = pd.concat([frame for _, frame in segments], ignore_index=True)
+        self.alive = np.asarray(alive, dtype=bool)
+        self.df = np.asarray(df, dtype=np.int64)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.generation = manifest['generation']
+        self.index_id = manifest.get('index_id', '')
+        self.tier_quantile = manifest['tier_quantile']
+        self.n_docs_at_refresh = manifest['n_docs_at_refresh']
+        self.watermark = manifest['watermark']
+        self.segment_names = list(manifest['segments'])
+        self.retired = []
+        self._pending = []
+        ids = self.catalog['id'].to_numpy()
+        self.rows = {int(ids[row]): int(row) for row in np.flatnonzero(self.alive)}
+        self.candidate_mask = self._tier_mask()
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def create(cls, records, path=DEFAULT_LIVE_DIR, tier_quantile=TIER_QUANTILE):
+        """Fit the vocabulary over ``records`` and publish generation 1 to ``path``, replacing any existing index."""
+        frame = prepare_records(records)
+        with metrics.span('vectorize', phase='fit'):
+            vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32).fit(frame['description'])
+            vocabulary = {term: int(col) for term, col in vectorizer.vocabulary_.items()}
+            tf = CountVectorizer(stop_words='english', vocabulary=vocabulary, dtype=np.float32).transform(
+                frame['description']).tocsr()
+        df = np.bincount(tf.indices, minlength=len(vocabulary))
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.live-', dir=parent)
+        manifest = {
+            'generation': 0,
+            # Generations restart at 1 on every init; the id keeps their snapshots apart.
+            'index_id': uuid.uuid4().hex,
+            'segments': [],
+            'tier_quantile': tier_quantile,
+            'n_docs_at_refresh': len(frame),
+            'watermark': 0.0,
+        }
+        try:
+            with open(os.path.join(tmp_dir, VOCABULARY), 'w') as f:
+                json.dump(vocabulary, f)
+            live = cls(tmp_dir, vocabulary, [(tf, frame)], np.ones(len(frame), dtype=bool), df,
+                       smooth_idf(df, len(frame)), manifest)
+            live.segment_names, live._pending = [], [(tf, frame)]
+            live.commit()
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.rename(tmp_dir, path)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        live.path = path
+        return live
+
+    @classmethod
+    def open(cls, path=DEFAULT_LIVE_DIR):
+        with metrics.span('load', source='live_index'):
+            with open(os.path.join(path, MANIFEST)) as f:
+                manifest = json.load(f)
+            with open(os.path.join(path, VOCABULARY)) as f:
+                vocabulary = json.load(f)
+            segments = [
+                (sparse.load_npz(os.path.join(path, f"{name}.npz")).tocsr(),
+                 pd.read_parquet(os.path.join(path, f"{name}.parquet")))
+                for name in manifest['segments']
+            ]
+            state = np.load(os.path.join(path, manifest['state']))
+            return cls(path, vocabulary, segments, state['alive'], state['df'], state['idf'], manifest)
+
+    def _tier_mask(self):
+        popularity = self.catalog['popularity'].to_numpy()
+        live_popularity = popularity[self.alive]
+        if not np.isfinite(live_popularity).any():
+            return np.zeros(len(popularity), dtype=bool)
+        threshold = np.nanquantile(live_popularity, self.tier_quantile)
+        # MAL popularity is a rank, so larger numbers mean less popular titles.
+        return self.alive & (popularity > threshold)
+
+    def _tombstone(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows):
+            self.alive[rows] = False
+            self.df -= np.bincount(self.tf[rows].indices, minlength=len(self.df))
+
+    def upsert(self, records):
+        """Append new and changed ``records`` (crawler rows); returns counts of what changed."""
+        frame = prepare_records(records).drop_duplicates('id', keep='last')
+        hashes = self.catalog['row_hash'].to_numpy()
+        current = frame['id'].map(self.rows)
+        unchanged = current.notna() & (frame['row_hash'].to_numpy() == hashes[current.fillna(0).astype(np.int64)])
+        frame = frame[~unchanged].reset_index(drop=True)
+        replaced = current[~unchanged].dropna().astype(np.int64).to_numpy()
+        stats = {'added': len(frame) - len(replaced), 'updated': len(replaced), 'unchanged': int(unchanged.sum())}
+        if len(frame):
+            with metrics.span('vectorize', phase='update', rows=len(frame)):
+                tf = self.counter.transform(frame['description']).tocsr()
+            self._tombstone(replaced)
+            first_row = len(self.catalog)
+            self.tf = sparse.vstack([self.tf, tf], format='csr', dtype=np.float32)
+            self.catalog = pd.concat([self.catalog, frame], ignore_index=True)
+            self.alive = np.concatenate([self.alive, np.ones(len(frame), dtype=bool)])
+            self.df += np.bincount(tf.indices, minlength=len(self.df))
+            self.rows.update(zip(frame['id'].tolist(), range(first_row, first_row + len(frame))))
+            self._pending.append((tf, frame))
+        stats.update(self._after_change())
+        return stats
+
+    def remove(self, ids):
+        """Tombstone the rows for ``ids``; returns the number of titles removed."""
+        rows = [self.rows.pop(int(anime_id)) for anime_id in ids if int(anime_id) in self.rows]
+        self._tombstone(rows)
+        self._after_change()
+        return len(rows)
+
+    def _after_change(self):
+        refreshed = abs(len(self.rows) - self.n_docs_at_refresh) > IDF_REFRESH_DRIFT * max(self.n_docs_at_refresh, 1)
+        if refreshed:
+            self.refresh_idf()
+        previous = self.candidate_mask
+        self.candidate_mask = self._tier_mask()
+        # Rows added since the previous mask count as tier changes only if they are candidates.
+        previous = np.concatenate([previous, np.zeros(len(self.candidate_mask) - len(previous), dtype=bool)])
+        return {'tier_changes': int((previous != self.candidate_mask).sum()), 'idf_refreshed': refreshed}
+
+    def refresh_idf(self):
+        """Recompute the IDF from the live document frequencies."""
+        self.idf = smooth_idf(self.df, len(self.rows))
+        self.n_docs_at_refresh = len(self.rows)
+
+    def compact(self):
+        """Rewrite the live rows as a single segment, dropping tombstones. Row numbers change."""
+        live_rows = np.flatnonzero(self.alive)
+        tf = self.tf[live_rows]
+        frame = self.catalog.iloc[live_rows].reset_index(drop=True)
+        self.retired.extend(self.segment_names)
+        self.segment_names, self._pending = [], [(tf, frame)]
+        self.tf, self.catalog = tf, frame
+        self.alive = np.ones(len(frame), dtype=bool)
+        self.candidate_mask = self._tier_mask()
+        self.rows = {anime_id: row for row, anime_id in enumerate(frame['id'].tolist())}
+
+    def commit(self, watermark=None):
+        """Write pending segments and the new state, then publish them by replacing the manifest."""
+        if watermark is not None:
+            self.watermark = watermark
+        self.generation += 1
+        for tf, frame in self._pending:
+            name = f"segment-{self.generation:06d}-{len(self.segment_names):04d}"
+            sparse.save_npz(os.path.join(self.path, f"{name}.npz"), tf)
+            frame.to_parquet(os.path.join(self.path, f"{name}.parquet"), index=False)
+            self.segment_names.append(name)
+        self._pending = []
+        self._write_snapshot()
+        state = f"state-{self.generation:06d}.npz"
+        np.savez(os.path.join(self.path, state), alive=self.alive, df=self.df, idf=self.idf)
+
+        previous = self._read_manifest()
+        manifest = {
+            'generation': self.generation,
+            'index_id': self.index_id,
+            'segments': self.segment_names,
+            'state': state,
+            'tier_quantile': self.tier_quantile,
+            'n_docs_at_refresh': self.n_docs_at_refresh,
+            'watermark': self.watermark,
+            'retired': self.retired + ([previous['state']] if previous else []),
+            'updated_at': time.time(),
+            'rows': len(self.catalog),
+            'live_rows': len(self.rows),
+        }
+        tmp_path = os.path.join(self.path, f".{MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+        self._prune(manifest)
+        self.retired = []
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _prune(self, manifest):
+        # Files retired by this generation are kept for readers that opened the
+        # previous manifest; anything older than that is removed.
+        keep = {MANIFEST, VOCABULARY, manifest['state'], *manifest['retired']}
+        keep |= {f"{name}.{ext}" for name in manifest['segments'] + manifest['retired'] for ext in ('npz', 'parquet')}
+        for name in os.listdir(self.path):
+            if name.startswith(('segment-', 'state-')) and name not in keep:
+                os.remove(os.path.join(self.path, name))
+        snapshots = os.path.join(self.path, 'snapshots')
+        if os.path.isdir(snapshots):
+            for name in os.listdir(snapshots):
+                if name.isdigit() and int(name) < manifest['generation'] - 1:
+                    shutil.rmtree(os.path.join(snapshots, name), ignore_errors=True)
+
+    def _write_snapshot(self):
+        # A plain index directory over the live rows, so app workers memory-map
+        # it like any prebuilt index instead of each rebuilding it in memory.
+        live_rows = np.flatnonzero(self.alive)
+        catalog = self.catalog.iloc[live_rows].drop(columns='row_hash').reset_index(drop=True)
+        matrix = normalize(self.tf[live_rows].multiply(self.idf).tocsr()).astype(np.float32)
+        vectorizer = TfidfVectorizer(stop_words='english', vocabulary=self.vocabulary, dtype=np.float32)
+        vectorizer.idf_ = self.idf
+        genres, genre_names = genre_matrix(catalog['genres'])
+        write_index(snapshot_path(self.path, self.generation), catalog, vectorizer, matrix, genres, genre_names,
+                    snapshot_version(self.index_id, self.generation),
+                    candidate_mask=self.candidate_mask[live_rows])
+
+    def snapshot(self):
+        """:class:`~anirecci.index.AnimeIndex` of the last committed generation, with its tier as candidates."""
+        return read_index(snapshot_path(self.path, self.generation))
+
+
+def snapshot_path(path, generation):
+    return os.path.join(path, 'snapshots', str(generation))
+
+
+def snapshot_version(index_id, generation):
+    """Version of a snapshot, stored as its ``csv_hash``; unique across re-inits of the live index."""
+    return f"live-{index_id}-{generation}" if index_id else f"live-{generation}"
+
+
+def current_snapshot(path=DEFAULT_LIVE_DIR):
+    """``(version, snapshot directory)`` of the newest committed generation, from the manifest alone."""
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    return (snapshot_version(manifest.get('index_id', ''), manifest['generation']),
+            snapshot_path(path, manifest['generation']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the AniRecci live index.")
+    parser.add_argument('--path', default=DEFAULT_LIVE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    init = commands.add_parser('init', help="fit the vocabulary and write a fresh index from a catalog CSV")
+    init.add_argument('csv_path', nargs='?', default=DEFAULT_RAW_CSV)
+    init.add_argument('--tier-quantile', type=float, default=TIER_QUANTILE)
+    update = commands.add_parser('update', help="apply titles added or changed in the crawler store")
+    update.add_argument('--store', default=DEFAULT_STORE_PATH)
+    update.add_argument('--csv', help="upsert every row of this catalog CSV instead of reading the store")
+    commands.add_parser('refresh-idf', help="recompute the IDF from the live document frequencies")
+    commands.add_parser('compact', help="merge segments and drop tombstoned rows")
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    if args.command == 'init':
+        catalog = load_catalog(args.csv_path)
+        live = LiveIndex.create(catalog.to_dict('records'), args.path, tier_quantile=args.tier_quantile)
+        print(f"Live index with {len(live)} titles written to {args.path}")
+    elif args.command == 'update':
+        live = LiveIndex.open(args.path)
+        if args.csv:
+            records, watermark = load_catalog(args.csv).to_dict('records'), None
+        else:
+            store = CatalogStore(args.store)
+            try:
+                records, watermark = store.changed_since(live.watermark)
+            finally:
+                store.close()
+        stats = live.upsert(records)
+        live.commit(watermark)
+        print(f"{stats['added']} added, {stats['updated']} updated, {stats['unchanged']} unchanged, "
+              f"{stats['tier_changes']} tier changes")
+    else:
+        live = LiveIndex.open(args.path)
+        if args.command == 'refresh-idf':
+            live.refresh_idf()
+        else:
+            live.compact()
+        live.commit()
+        print(f"Generation {live.generation}: {len(live)} live titles")
+    print(f"Done in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Process-wide latency spans and cache counters.
+
+Stages are timed with ``with metrics.span('score'):``; counters with
+``metrics.incr('jikan_cache_hit')``. Every Streamlit session in the process
+shares the same registry, so percentiles reflect real concurrent load.
+
+If ``ANIRECCI_METRICS_LOG`` names a file, each finished span is also appended
+to it as JSONL by a background thread (the log is not rotated, so enable it
+for profiling runs rather than in production). If ``ANIRECCI_METRICS_PORT`` is
+set the app serves Prometheus text format on ``/metrics`` (plus health checks,
+see :mod:`anirecci.startup`).
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Off unless set, e.g. ANIRECCI_METRICS_LOG=artifacts/metrics.jsonl.
+DEFAULT_LOG_PATH = os.environ.get('ANIRECCI_METRICS_LOG') or None
+# Most recent durations kept per stage for percentile estimates.
+RESERVOIR_SIZE = 10000
+PERCENTILES = (50, 95, 99)
+
+
+class _JsonlWriter(threading.Thread):
+    """Appends records to a file off the request thread."""
+
+    def __init__(self, path):
+        super().__init__(name='anirecci-metrics-writer', daemon=True)
+        self.path = path
+        self.records = queue.SimpleQueue()
+
+    def run(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as f:
+            while True:
+                records = [self.records.get()]
+                while not self.records.empty():
+                    records.append(self.records.get_nowait())
+                f.writelines(json.dumps(record) + '\n' for record in records)
+                f.flush()
+
+
+class Metrics:
+    def __init__(self, log_path=DEFAULT_LOG_PATH):
+        self.lock = threading.Lock()
+        self.durations = defaultdict(lambda: deque(maxlen=RESERVOIR_SIZE))
+        self.counts = defaultdict(int)
+        self.totals = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.log_path = log_path
+        self.writer = None
+
+    def observe(self, stage, seconds, **labels):
+        with self.lock:
+            self.durations[stage].append(seconds)
+            self.counts[stage] += 1
+            self.totals[stage] += seconds
+        if self.log_path:
+            self._writer().records.put({'ts': time.time(), 'stage': stage, 'seconds': seconds, **labels})
+
+    def _writer(self):
+        # Started lazily so importing this module never spawns a thread.
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    self.writer = _JsonlWriter(self.log_path)
+                    self.writer.start()
+        return self.writer
+
+    @contextmanager
+    def span(self, stage, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start_time, **labels)
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def summary(self):
+        """Per-stage count, total and p50/p95/p99 seconds, plus counters."""
+        with self.lock:
+            samples = {stage: np.array(values) for stage, values in self.durations.items()}
+            counts, totals, counters = dict(self.counts), dict(self.totals), dict(self.counters)
+        stages = {}
+        for stage, values in sorted(samples.items()):
+            stats = {'count': counts[stage], 'total': totals[stage]}
+            for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                stats[f"p{p}"] = float(value)
+            stages[stage] = stats
+        return {'stages': stages, 'counters': dict(sorted(counters.items()))}
+
+    def hit_rate(self, name):
+        """Hit ratio for a ``<name>_hit`` / ``<name>_miss`` counter pair, or ``None``."""
+        with self.lock:
+            hits, misses = self.counters.get(f"{name}_hit", 0), self.counters.get(f"{name}_miss", 0)
+        return hits / (hits + misses) if hits + misses else None
+
+    def prometheus_text(self):
+        summary = self.summary()
+        lines = ['# TYPE anirecci_stage_seconds summary']
+        for stage, stats in summary['stages'].items():
+            for p in PERCENTILES:
+                lines.append(f'anirecci_stage_seconds{{stage="{stage}",quantile="{p / 100}"}} {stats[f"p{p}"]}')
+            lines.append(f'anirecci_stage_seconds_sum{{stage="{stage}"}} {stats["total"]}')
+            lines.append(f'anirecci_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append('# TYPE anirecci_events_total counter')
+        for name, value in summary['counters'].items():
+            lines.append(f'anirecci_events_total{{name="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def serve_prometheus(port, registry=None, host='0.0.0.0', health=None):
+    """Serve ``/metrics`` in Prometheus text format from a daemon thread.
+
+    With a ``health`` callable returning a dict with a ``ready`` flag, also
+    serve ``/healthz`` (always 200 while the process is up) and ``/readyz``
+    (503 until ``ready``), both with the dict as a JSON body.
+    """
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if health is not None and path in ('/healthz', '/readyz'):
+                state = health()
+                code = 200 if path == '/healthz' or state.get('ready') else 503
+                body, content_type = json.dumps(state).encode(), 'application/json'
+            elif path == '/metrics':
+                code, body = 200, registry.prometheus_text().encode()
+                content_type = 'text/plain; version=0.0.4'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='anirecci-metrics-http', daemon=True).start()
+    return server
+
+
+metrics = Metrics()
@@ -0,0 +1,194 @@
+"""Multi-seed profile scoring.
+
+Averaging every seed into one centroid blurs mixed tastes together: a user
+who likes both a mecha show and a slice-of-life comedy gets candidates that
+are lukewarm for both. :class:`ProfileScorer` keeps the seeds apart instead.
+Each seed is one row of a fused query matrix, and a single sparse product
+gives a ``seeds x candidates`` score matrix. That matrix is reduced with one
+of the :data:`AGGREGATIONS`:
+
+* ``max`` - a candidate's best score against any seed
+* ``mean`` - its average score over the seeds
+* ``rrf`` - reciprocal-rank fusion of the per-seed rankings, insensitive
+  to how scores are scaled for each seed
+* ``quota`` - seeds take turns picking their best remaining candidate, so
+  every seed is represented in the top k
+
+Unweighted per-seed vectors are cached by MAL id. Seeds from the catalog
+reuse their indexed rows, so only seeds fetched from Jikan are run through
+the vectorizer, and only once.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+AGGREGATIONS = ('max', 'mean', 'rrf', 'quota')
+# Rank offset in reciprocal-rank fusion; 60 is the value from the original RRF paper.
+RRF_K = 60
+# Only each seed's top ranks contribute to the fused score.
+RRF_DEPTH = 200
+SEED_CACHE_SIZE = 4096
+
+
+class ProfileScorer:
+    """Scores candidates of a :class:`~anirecci.recommender.Recommender` against each seed separately."""
+
+    def __init__(self, recommender, cache_size=SEED_CACHE_SIZE):
+        self.recommender = recommender
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        catalog_ids = recommender.index.catalog['id'].to_numpy()
+        self.catalog_rows = {int(anime_id): row for row, anime_id in enumerate(catalog_ids)}
+
+    def seed_matrix(self, seeds):
+        """Unweighted fused rows ``[tfidf | genres | 1]``, one per seed, as CSR."""
+        n_features = self.recommender.candidate_matrix.shape[1]
+        vectors = [None] * len(seeds)
+        with self.lock:
+            for i, seed in enumerate(seeds):
+                vector = self.cache.get(seed.get('id'))
+                if vector is not None:
+                    self.cache.move_to_end(seed.get('id'))
+                    vectors[i] = vector
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            rows = self._vectorize([seeds[i] for i in missing])
+            with self.lock:
+                for j, i in enumerate(missing):
+                    # Rows are kept as (indices, data) pairs; slicing CSR rows one by one is far slower.
+                    start, end = rows.indptr[j], rows.indptr[j + 1]
+                    vectors[i] = (rows.indices[start:end], rows.data[start:end])
+                    if seeds[i].get('id') is not None:
+                        self.cache[seeds[i]['id']] = vectors[i]
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+        np.cumsum([len(indices) for indices, _ in vectors], out=indptr[1:])
+        if not vectors:
+            return sparse.csr_matrix((0, n_features), dtype=np.float32)
+        return sparse.csr_matrix((np.concatenate([data for _, data in vectors]),
+                                  np.concatenate([indices for indices, _ in vectors]), indptr),
+                                 shape=(len(vectors), n_features))
+
+    def _vectorize(self, seeds):
+        # Catalog seeds reuse their indexed rows; the rest share one transform.
+        recommender, index = self.recommender, self.recommender.index
+        rows = [self.catalog_rows.get(seed.get('id')) for seed in seeds]
+        indexed = [i for i, row in enumerate(rows) if row is not None]
+        unindexed = [i for i, row in enumerate(rows) if row is None]
+        blocks = []
+        if indexed:
+            positions = [rows[i] for i in indexed]
+            blocks.append(sparse.hstack([
+                index.matrix[positions],
+                normalize(index.genre_matrix[positions].astype(np.float32)),
+            ], format='csr', dtype=np.float32))
+        if unindexed:
+            descriptions = [seeds[i].get('description') or '' for i in unindexed]
+            blocks.append(sparse.hstack([
+                index.vectorizer.transform(descriptions),
+                np.vstack([recommender.genre_vector([seeds[i].get('genres')]) for i in unindexed]),
+            ], format='csr', dtype=np.float32))
+        ones = sparse.csr_matrix(np.ones((len(seeds), 1), dtype=np.float32))
+        fused = sparse.hstack([sparse.vstack(blocks, format='csr'), ones], format='csr', dtype=np.float32)
+        # Back to the order of ``seeds``.
+        return fused[np.argsort(indexed + unindexed, kind='stable')]
+
+    def score_matrix(self, seeds, weights):
+        """Dense ``(len(seeds), n_candidates)`` fused scores, from one sparse product."""
+        recommender = self.recommender
+        scale = np.concatenate([
+            np.full(recommender.n_text, weights['text'], dtype=np.float32),
+            np.full(recommender.n_genres, weights['genre'], dtype=np.float32),
+            [weights['rating']],
+        ]).astype(np.float32)
+        queries = self.seed_matrix(seeds).multiply(scale).tocsr()
+        # A dense right-hand side is faster than a sparse x sparse product here.
+        return np.ascontiguousarray((recommender.candidate_matrix @ queries.T.toarray()).T)
+
+    def _scores(self, seeds, weights, exclude_positions, bonus):
+        scores = self.score_matrix(seeds, weights)
+        if bonus is not None:
+            scores += bonus
+        scores[:, list(exclude_positions)] = -np.inf
+        return scores
+
+    def shortlists(self, seeds, depth, weights, exclude_positions=(), bonus=None):
+        """Each seed's ``depth`` best candidates, flattened: positions, scores and the seed of each entry."""
+        scores = self._scores(seeds, weights, exclude_positions, bonus)
+        depth = min(depth, scores.shape[1])
+        if depth == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        positions = _top_per_row(scores, depth)
+        top_scores = np.take_along_axis(scores, positions, axis=1)
+        groups = np.repeat(np.arange(len(scores)), depth)
+        finite = np.isfinite(top_scores.ravel())
+        return positions.ravel()[finite], top_scores.ravel()[finite], groups[finite]
+
+    def rank(self, seeds, k, weights, mode, exclude_positions=(), bonus=None):
+        """Top ``k`` candidate positions and aggregated scores for ``seeds``.
+
+        ``bonus`` (one value per candidate, e.g. the feedback term) is added to
+        every seed's scores before aggregating.
+        """
+        if mode not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {mode!r}; expected one of {AGGREGATIONS}")
+        scores = self._scores(seeds, weights, exclude_positions, bonus)
+        n_results = min(k, scores.shape[1])
+        if n_results == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if mode == 'quota':
+            return _round_robin(scores, n_results)
+        if mode == 'max':
+            aggregated = scores.max(axis=0)
+        elif mode == 'mean':
+            aggregated = scores.mean(axis=0)
+        else:
+            depth = min(max(RRF_DEPTH, n_results), scores.shape[1])
+            ranked = _top_per_row(scores, depth)
+            aggregated = np.zeros(scores.shape[1], dtype=np.float32)
+            np.add.at(aggregated, ranked.ravel(), np.tile(1.0 / (RRF_K + 1 + np.arange(depth)), len(scores)))
+            aggregated[~np.isfinite(scores).any(axis=0)] = -np.inf
+        top = np.argpartition(-aggregated, n_results - 1)[:n_results]
+        top = top[np.argsort(-aggregated[top], kind='stable')]
+        top = top[np.isfinite(aggregated[top])]
+        return top, aggregated[top]
+
+
+def _top_per_row(scores, depth):
+    """Column positions of each row's ``depth`` best scores, best first."""
+    top = np.argpartition(-scores, depth - 1, axis=1)[:, :depth]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _round_robin(scores, k):
+    """Seeds take turns picking their best unpicked candidate; returns positions and the picking seed's score."""
+    depth = min(k, scores.shape[1])
+    per_seed = _top_per_row(scores, depth)
+    picked, picked_scores, seen = [], [], set()
+    cursors = np.zeros(len(scores), dtype=np.int64)
+    while len(picked) < k:
+        progressed = False
+        for seed in range(len(scores)):
+            while cursors[seed] < depth and per_seed[seed, cursors[seed]] in seen:
+                cursors[seed] += 1
+            if cursors[seed] == depth:
+                continue
+            position = per_seed[seed, cursors[seed]]
+            if not np.isfinite(scores[seed, position]):
+                cursors[seed] = depth
+                continue
+            seen.add(position)
+            picked.append(position)
+            picked_scores.append(scores[seed, position])
+            progressed = True
+            if len(picked) == k:
+                break
+        if not progressed:
+            break
+    return np.asarray(picked, dtype=np.int64), np.asarray(picked_scores, dtype=np.float32)
@@ -0,0 +1,248 @@
+"""Vectorized hybrid scoring over the lesser-known candidate tier of the catalog."""
+import os
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from anirecci.diversity import DIVERSITY, POOL, mmr
+from anirecci.index import published_arrays
+from anirecci.metrics import metrics
+from anirecci.profile import ProfileScorer
+from anirecci.similarity import DEFAULT_BACKEND, build_backend
+
+# Titles less popular than this quantile of the catalog are recommendation candidates.
+POPULARITY_QUANTILE = 0.5
+# Relative weight of description cosine, genre cosine, normalised rating and
+# the feedback re-ranking term.
+DEFAULT_WEIGHTS = {'text': 1.0, 'genre': 0.15, 'rating': 0.05, 'feedback': 0.05}
+# With a feedback model, this many times k candidates are re-ranked.
+RERANK_DEPTH = 5
+# How multi-seed requests are scored: 'centroid' averages the seeds into one
+# query, anything else is an aggregation from anirecci.profile.
+AGGREGATION = os.environ.get('ANIRECCI_AGGREGATION', 'rrf')
+
+
+class Recommender:
+    """Scores catalog candidates against a set of seed anime.
+
+    ``candidate_rows`` maps each candidate position to its row in the full
+    catalog, so results always line up with the data they were scored on.
+
+    Each candidate is one row of a fused sparse matrix
+    ``[tfidf | genre multi-hot (L2-normalised) | rating / 10]``, built once
+    here. A query is the matching ``[w_text * q_text | w_genre * q_genre | w_rating]``
+    vector, so the weighted text cosine + genre cosine + rating score is a
+    single mat-vec, and weights can change per request without a rebuild.
+    The fused matrix is searched with the configured similarity backend (see
+    :mod:`anirecci.similarity`).
+    """
+
+    def __init__(self, anime_index, popularity_quantile=POPULARITY_QUANTILE, backend=DEFAULT_BACKEND,
+                 weights=None, aggregation=AGGREGATION, diversity=DIVERSITY):
+        self.index = anime_index
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.aggregation = aggregation
+        self.diversity = diversity
+        self._profile = None
+        catalog = anime_index.catalog
+        self.genre_columns = {name: i for i, name in enumerate(anime_index.genre_names)}
+        self.n_text = anime_index.matrix.shape[1]
+        self.n_genres = len(anime_index.genre_names)
+
+        # The candidate rows and fused matrix are written next to the index
+        # once and memory-mapped, so every worker process shares one copy.
+        self.tier = 'mask' if anime_index.candidate_mask is not None else f"q{popularity_quantile}"
+        arrays = published_arrays(os.path.join(anime_index.path, f"candidates-{self.tier}"),
+                                  lambda: self._fuse_candidates(popularity_quantile))
+        self.candidate_rows = arrays['rows']
+        self.candidate_matrix = sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']), copy=False)
+        self.candidate_ids = catalog['id'].to_numpy()[self.candidate_rows]
+        self.candidate_positions = {int(anime_id): i for i, anime_id in enumerate(self.candidate_ids)}
+
+        cache_path = os.path.join(anime_index.path, f"{backend}-q{popularity_quantile}.npz")
+        self.backend = build_backend(backend, self.candidate_matrix, cache_path=cache_path)
+
+    def __len__(self):
+        return len(self.candidate_rows)
+
+    @property
+    def profile(self):
+        """Per-seed :class:`~anirecci.profile.ProfileScorer`, created on first multi-seed request."""
+        if self._profile is None:
+            self._profile = ProfileScorer(self)
+        return self._profile
+
+    def diversify(self, positions, scores, k, diversity=None, groups=None):
+        """Top ``k`` of a ranked shortlist of candidate positions, re-ranked by MMR.
+
+        Uses the index's precomputed similarity graph; indexes without one keep
+        the shortlist order. ``groups`` are passed on to
+        :func:`~anirecci.diversity.mmr`.
+        """
+        diversity = self.diversity if diversity is None else diversity
+        graph = self.index.similarity_graph
+        if diversity >= 1 or graph is None:
+            return positions[:k], scores[:k]
+        with metrics.span('diversify'):
+            picked = mmr(self.candidate_rows[positions], scores, graph, k, diversity, groups)
+        return positions[picked], scores[picked]
+
+    def _fuse_candidates(self, popularity_quantile):
+        anime_index = self.index
+        catalog = anime_index.catalog
+        if anime_index.candidate_mask is not None:
+            # Tier maintained by the index itself (see anirecci.live_index)
+            rows = np.flatnonzero(anime_index.candidate_mask)
+        else:
+            popularity = catalog['popularity'].to_numpy(dtype=np.float64, na_value=np.nan)
+            threshold = np.nanquantile(popularity, popularity_quantile)
+            # MAL popularity is a rank, so larger numbers mean less popular titles.
+            rows = np.flatnonzero(popularity > threshold)
+        text = anime_index.matrix[rows]
+        genres = normalize(anime_index.genre_matrix[rows].astype(np.float32))
+        rating = np.nan_to_num(catalog['rating'].to_numpy(dtype=np.float32, na_value=np.nan)[rows]) / 10
+        matrix = sparse.hstack([text, genres, sparse.csr_matrix(rating.reshape(-1, 1))], format='csr',
+                               dtype=np.float32)
+        matrix.sort_indices()
+        return {'rows': rows, 'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr,
+                'shape': np.array(matrix.shape)}
+
+    def text_vector(self, descriptions):
+        """Mean TF-IDF vector of the seed descriptions, L2-normalised."""
+        features = np.asarray(self.index.vectorizer.transform(descriptions).mean(axis=0)).ravel()
+        norm = np.linalg.norm(features)
+        return features / norm if norm else features
+
+    def genre_vector(self, seed_genres):
+        """Mean of the seeds' L2-normalised genre multi-hots, L2-normalised."""
+        vector = np.zeros(self.n_genres, dtype=np.float32)
+        for genres in seed_genres:
+            if genres is None:
+                continue
+            cols = {self.genre_columns[g.lower()] for g in genres if g.lower() in self.genre_columns}
+            if cols:
+                vector[list(cols)] += 1 / np.sqrt(len(cols))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def query_vector(self, seeds, weights=None):
+        """Fused query for ``seeds`` (dicts with ``description`` and ``genres``)."""
+        weights = {**self.weights, **(weights or {})}
+        descriptions = [seed['description'] for seed in seeds if seed.get('description')]
+        text = self.text_vector(descriptions) if descriptions else np.zeros(self.n_text, dtype=np.float32)
+        genres = self.genre_vector([seed.get('genres', []) for seed in seeds])
+        return np.concatenate(
+            [weights['text'] * text, weights['genre'] * genres, [weights['rating']]]).astype(np.float32)
+
+    def query_matrix(self, seed_sets, weights=None):
+        """Fused queries for many seed sets at once, one CSR row per set.
+
+        All descriptions go through the vectorizer in a single ``transform``
+        and are averaged per set with a sparse aggregation matrix.
+        """
+        weights = {**self.weights, **(weights or {})}
+        descriptions, desc_sets, genre_rows, genre_cols, genre_vals = [], [], [], [], []
+        for i, seeds in enumerate(seed_sets):
+            for seed in seeds:
+                if seed.get('description'):
+                    descriptions.append(seed['description'])
+                    desc_sets.append(i)
+            genres = self.genre_vector([seed.get('genres', []) for seed in seeds])
+            cols = np.flatnonzero(genres)
+            genre_rows.extend([i] * len(cols))
+            genre_cols.extend(cols)
+            genre_vals.extend(genres[cols])
+
+        n_sets = len(seed_sets)
+        text = sparse.csr_matrix((n_sets, self.n_text), dtype=np.float32)
+        if descriptions:
+            features = self.index.vectorizer.transform(descriptions)
+            aggregate = sparse.csr_matrix(
+                (np.ones(len(desc_sets), dtype=np.float32), (desc_sets, np.arange(len(desc_sets)))),
+                shape=(n_sets, len(descriptions)))
+            text = normalize(aggregate @ features)
+        genres = sparse.csr_matrix((genre_vals, (genre_rows, genre_cols)), shape=(n_sets, self.n_genres),
+                                   dtype=np.float32)
+        rating = sparse.csr_matrix(np.full((n_sets, 1), weights['rating'], dtype=np.float32))
+        return sparse.hstack([weights['text'] * text, weights['genre'] * genres, rating],
+                             format='csr', dtype=np.float32)
+
+    def recommend_batch(self, seed_sets, k, weights=None):
+        """Top ``k`` candidate MAL ids and scores for each seed set, from one sparse product.
+
+        Always uses the exact fused matrix. Returns ``(ids, scores)`` arrays of
+        shape ``(len(seed_sets), k)``; rows with fewer than ``k`` results are
+        padded with id ``-1`` and score ``nan``. Seeds are excluded from their
+        own results.
+        """
+        scores = (self.candidate_matrix @ self.query_matrix(seed_sets, weights).T).toarray()
+        for i, seeds in enumerate(seed_sets):
+            for seed in seeds:
+                position = self.candidate_positions.get(seed.get('id'))
+                if position is not None:
+                    scores[position, i] = -np.inf
+
+        n_results = min(k, scores.shape[0])
+        top = np.argpartition(-scores, n_results - 1, axis=0)[:n_results]
+        top_scores = np.take_along_axis(scores, top, axis=0)
+        ranked = np.argsort(-top_scores, axis=0, kind='stable')
+        top = np.take_along_axis(top, ranked, axis=0).T
+        top_scores = np.take_along_axis(top_scores, ranked, axis=0).T
+
+        ids = np.full((len(seed_sets), k), -1, dtype=np.int64)
+        result_scores = np.full((len(seed_sets), k), np.nan, dtype=np.float32)
+        valid = np.isfinite(top_scores)
+        ids[:, :n_results] = np.where(valid, self.candidate_ids[top], -1)
+        result_scores[:, :n_results] = np.where(valid, top_scores, np.nan)
+        return ids, result_scores
+
+    def recommend(self, seeds, k, weights=None, exclude_ids=None, feedback=None, aggregation=None,
+                  diversity=None):
+        """Catalog rows and scores of the ``k`` best candidates for ``seeds``.
+
+        The seeds themselves are excluded, along with any ``exclude_ids``. With
+        a :class:`~anirecci.feedback.FeedbackModel`, a deeper shortlist is
+        re-ranked by the weighted feedback term. Several seeds are scored
+        separately and combined with ``aggregation`` (default
+        ``self.aggregation``) unless it is ``'centroid'``. With ``diversity``
+        (default ``self.diversity``) below 1, the top ``k`` are picked from a
+        longer shortlist by :meth:`diversify`.
+        """
+        weights = {**self.weights, **(weights or {})}
+        seed_ids = [seed['id'] for seed in seeds if seed.get('id') is not None]
+        exclude_ids = set(exclude_ids or ()) | set(seed_ids)
+        rerank = feedback is not None and len(feedback.ids) and weights['feedback']
+        aggregation = aggregation or self.aggregation
+        diversity = self.diversity if diversity is None else diversity
+        shortlist = k * POOL if diversity < 1 else k
+        if aggregation != 'centroid' and len(seeds) > 1:
+            with metrics.span('score', backend='profile', aggregation=aggregation):
+                exclude = [self.candidate_positions[i] for i in exclude_ids if i in self.candidate_positions]
+                # The feedback term is added to every seed's scores before aggregating.
+                bonus = weights['feedback'] * feedback.scores(seed_ids, self.candidate_ids) if rerank else None
+                if aggregation == 'quota' and shortlist > k and self.index.similarity_graph is not None:
+                    # Seeds take turns inside MMR, so each keeps its quota.
+                    depth = POOL * -(-k // len(seeds))
+                    positions, scores, groups = self.profile.shortlists(seeds, depth, weights, exclude, bonus)
+                    positions, scores = self.diversify(positions, scores, k, diversity, groups)
+                    return self.candidate_rows[positions], scores
+                positions, scores = self.profile.rank(seeds, shortlist, weights, aggregation, exclude, bonus)
+            positions, scores = self.diversify(positions, scores, k, diversity)
+            return self.candidate_rows[positions], scores
+        depth = max(k * RERANK_DEPTH if rerank else k, shortlist)
+        with metrics.span('vectorize', phase='query'):
+            query = self.query_vector(seeds, weights)
+        with metrics.span('score', backend=self.backend.name):
+            # Over-fetch by the number of exclusions so filtering never leaves us short.
+            positions, scores = self.backend.search(query, depth + len(exclude_ids))
+            if exclude_ids:
+                keep = ~np.isin(self.candidate_ids[positions], list(exclude_ids))
+                positions, scores = positions[keep], scores[keep]
+            if rerank:
+                scores = scores + weights['feedback'] * feedback.scores(seed_ids, self.candidate_ids[positions])
+                order = np.argsort(-scores, kind='stable')
+                positions, scores = positions[order], scores[order]
+        positions, scores = self.diversify(positions[:shortlist], scores[:shortlist], k, diversity)
+        return self.candidate_rows[positions], scores
@@ -0,0 +1,175 @@
+"""Resolve user-typed titles against the local catalog before hitting the API.
+
+Lookup order is: alias, exact normalised title, completion of the last
+word, then trigram similarity. Fuzzy matches are only accepted when they are
+near-exact - every word of the query matches a word of the title and vice
+versa - so "Fullmetal Alchemist Brotherhood" is not mistaken for the 2003
+series. Anything weaker is a miss and goes to Jikan. Matches are returned in
+the same dict shape as :func:`anirecci.jikan.parse_anime`.
+"""
+import bisect
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from anirecci.catalog import load_catalog
+from anirecci.metrics import metrics
+
+DEFAULT_CATALOG_CSV = 'raw_anime_data_paged.csv'
+DEFAULT_ALIASES_PATH = 'title_aliases.json'
+# Minimum trigram Jaccard similarity for a fuzzy match to be accepted.
+MIN_TRIGRAM_SIMILARITY = 0.5
+# Prefix matches shorter than this are too ambiguous ("a", "th") to trust.
+MIN_PREFIX_LENGTH = 4
+# Two words match when equal or at least this similar (trigram Jaccard), to allow typos.
+MIN_WORD_SIMILARITY = 0.4
+# Best trigram candidates checked word by word.
+TRIGRAM_CANDIDATES = 5
+
+
+def normalize_title(title):
+    """Lower-case, strip accents and punctuation, collapse whitespace."""
+    title = unicodedata.normalize('NFKD', str(title))
+    title = ''.join(c for c in title if not unicodedata.combining(c))
+    title = re.sub(r'[^\w\s]', ' ', title.casefold())
+    return re.sub(r'\s+', ' ', title).strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _word_similarity(a, b):
+    if a == b:
+        return 1.0
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def near_exact(query, title):
+    """Whether every word of ``query`` matches a word of ``title`` and vice versa (both normalised)."""
+    query_words, title_words = query.split(), title.split()
+    return (all(any(_word_similarity(q, t) >= MIN_WORD_SIMILARITY for t in title_words) for q in query_words)
+            and all(any(_word_similarity(t, q) >= MIN_WORD_SIMILARITY for q in query_words) for t in title_words))
+
+
+def load_aliases(path=DEFAULT_ALIASES_PATH):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {normalize_title(alias): normalize_title(title) for alias, title in json.load(f).items()}
+
+
+class TitleResolver:
+    """In-memory title index over a catalog frame with ``id``/``title``/``genres``/... columns."""
+
+    def __init__(self, catalog, aliases=None):
+        self.catalog = catalog.reset_index(drop=True)
+        self.aliases = aliases or {}
+        self.names = names = [normalize_title(t) for t in self.catalog['title']]
+        popularity = self.catalog['popularity'].fillna(np.inf).to_numpy()
+
+        # When two titles normalise the same way, keep the more popular one.
+        self.exact = {}
+        for row in np.argsort(popularity, kind='stable'):
+            self.exact.setdefault(names[row], int(row))
+
+        self.sorted_names = sorted(self.exact)
+        self.popularity = popularity
+
+        postings = defaultdict(list)
+        self.trigram_counts = np.zeros(len(names), dtype=np.int32)
+        for row, name in enumerate(names):
+            grams = trigrams(name)
+            self.trigram_counts[row] = len(grams)
+            for gram in grams:
+                postings[gram].append(row)
+        self.postings = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    @classmethod
+    def from_csv(cls, csv_path=DEFAULT_CATALOG_CSV, aliases_path=DEFAULT_ALIASES_PATH):
+        catalog = load_catalog(csv_path)
+        catalog['description'] = catalog['description'].fillna("")
+        return cls(catalog, load_aliases(aliases_path))
+
+    def _prefix_match(self, name):
+        # Only a truncated last word is completed ("cowboy beb"); a title that
+        # goes on with more words ("evangelion movie 1 jo") is a different one.
+        if len(name) < MIN_PREFIX_LENGTH:
+            return None
+        start = bisect.bisect_left(self.sorted_names, name)
+        rows = []
+        for i in range(start, len(self.sorted_names)):
+            candidate = self.sorted_names[i]
+            if not candidate.startswith(name):
+                break
+            if ' ' not in candidate[len(name):]:
+                rows.append(self.exact[candidate])
+        if not rows:
+            return None
+        return min(rows, key=lambda row: self.popularity[row])
+
+    def _trigram_match(self, name):
+        grams = trigrams(name)
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits:
+            return None
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.trigram_counts))
+        similarity = shared / (self.trigram_counts + len(grams) - shared)
+        count = min(TRIGRAM_CANDIDATES, len(similarity))
+        best = np.argpartition(-similarity, count - 1)[:count]
+        for row in best[np.argsort(-similarity[best], kind='stable')]:
+            if similarity[row] < MIN_TRIGRAM_SIMILARITY:
+                break
+            if near_exact(name, self.names[row]):
+                return int(row)
+        return None
+
+    def lookup(self, title):
+        """Catalog row for ``title``, or ``None`` if nothing matches well enough."""
+        name = normalize_title(title)
+        if not name:
+            return None
+        name = self.aliases.get(name, name)
+        if name in self.exact:
+            return self.exact[name]
+        row = self._prefix_match(name)
+        if row is None:
+            row = self._trigram_match(name)
+        return row
+
+    def record(self, row):
+        anime = self.catalog.iloc[row]
+        return {
+            'id': int(anime['id']),
+            'title': anime['title'],
+            'genres': list(anime['genres']),
+            'description': anime['description'],
+            'rating': 0 if pd.isna(anime['rating']) else float(anime['rating']),
+            'image_url': anime['image_url'] if pd.notna(anime['image_url']) else None,
+        }
+
+    def resolve(self, title):
+        with metrics.span('fetch', source='local'):
+            row = self.lookup(title)
+        metrics.incr('resolver_miss' if row is None else 'resolver_hit')
+        return None if row is None else self.record(row)
+
+
+def resolve_titles(titles, resolver, client=None):
+    """Resolve titles locally, falling back to ``client`` (a JikanClient) for misses.
+
+    Results keep the input order; unresolved titles are ``None``.
+    """
+    results = [resolver.resolve(title) for title in titles]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if client is not None and missing:
+        for i, result in zip(missing, client.search_many([titles[i] for i in missing])):
+            results[i] = result
+    return results
@@ -0,0 +1,124 @@
+"""Two-level cache of ranked recommendation lists.
+
+Popular seed combinations ("Naruto, One Piece") are requested over and over.
+Their ranked ids and scores are cached in an in-process LRU and, optionally,
+in a SQLite store shared by every app process on the host.
+
+Entries are keyed by the sorted set of resolved seed ids, the list depth and
+a version string (index version plus feedback model version). When the
+version changes, the memory level is cleared and stale rows are purged from
+disk, so results never outlive the index or feedback model they came from.
+Lists are cached ``depth`` deep and sliced on the way out, so any
+``k <= depth`` is served from the same entry.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from anirecci.metrics import metrics
+
+DEFAULT_CACHE_PATH = os.path.join('artifacts', 'result_cache.sqlite3')
+MAX_ENTRIES = 4096
+# Matches the app's slider maximum, so moving the slider never recomputes.
+DEPTH = 10
+# Disk entries are dropped after this long even if no version change purged them.
+DISK_TTL = 7 * 24 * 3600
+
+
+def cache_key(seed_ids, depth):
+    """Order- and duplicate-insensitive key for a set of seed ids."""
+    return f"{depth}:{','.join(str(i) for i in sorted({int(i) for i in seed_ids}))}"
+
+
+class ResultCache:
+    """LRU of ``key -> (ids, scores)`` in front of an optional SQLite store."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=MAX_ENTRIES, depth=DEPTH):
+        self.path = path
+        self.max_entries = max_entries
+        self.depth = depth
+        self.version = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS results ('
+                    ' version TEXT NOT NULL, key TEXT NOT NULL, ids BLOB NOT NULL, scores BLOB NOT NULL,'
+                    ' created_at REAL NOT NULL, PRIMARY KEY (version, key))'
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _check_version(self, version):
+        # Called with the lock held.
+        if version == self.version:
+            return
+        self.entries.clear()
+        self.version = version
+        if self.path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM results WHERE version != ? OR created_at <= ?',
+                             (version, time.time() - DISK_TTL))
+
+    def get(self, seed_ids, k, version):
+        """Top ``k`` ``(ids, scores)`` for ``seed_ids`` under ``version``, or ``None`` on a miss."""
+        if k > self.depth:
+            return None
+        key = cache_key(seed_ids, self.depth)
+        with self.lock:
+            self._check_version(version)
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+        if result is None and self.path:
+            with self._connect() as conn:
+                row = conn.execute('SELECT ids, scores FROM results WHERE version = ? AND key = ?',
+                                   (version, key)).fetchone()
+            metrics.incr('result_cache_disk_miss' if row is None else 'result_cache_disk_hit')
+            if row is not None:
+                result = np.frombuffer(row[0], dtype=np.int64), np.frombuffer(row[1], dtype=np.float32)
+                self._remember(key, result)
+        metrics.incr('result_cache_miss' if result is None else 'result_cache_hit')
+        if result is None:
+            return None
+        ids, scores = result
+        return ids[:k], scores[:k]
+
+    def put(self, seed_ids, ids, scores, version):
+        """Store a ranked list computed ``self.depth`` deep."""
+        key = cache_key(seed_ids, self.depth)
+        result = (np.asarray(ids, dtype=np.int64)[:self.depth], np.asarray(scores, dtype=np.float32)[:self.depth])
+        with self.lock:
+            self._check_version(version)
+        self._remember(key, result)
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO results (version, key, ids, scores, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (version, key, result[0].tobytes(), result[1].tobytes(), time.time()),
+                )
+
+    def _remember(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_compute(self, seed_ids, k, version, compute):
+        """Cached top ``k``, calling ``compute(depth) -> (ids, scores)`` on a miss."""
+        result = self.get(seed_ids, k, version)
+        if result is None:
+            ids, scores = compute(max(k, self.depth))
+            if k <= self.depth:
+                self.put(seed_ids, ids, scores, version)
+            result = ids[:k], scores[:k]
+        return result
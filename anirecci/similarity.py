@@ -0,0 +1,212 @@
+"""Pluggable similarity backends for scoring queries against candidate rows.
+
+``exact``
+    Brute-force cosine over the sparse TF-IDF matrix. Always correct, cost
+    grows linearly with the catalog.
+``ivf``
+    TF-IDF reduced with TruncatedSVD to a compact float32 embedding, then an
+    inverted-file index: rows are clustered with spherical k-means and a query
+    only scans the ``nprobe`` closest clusters. A shortlist of ``refine * k``
+    rows is then re-scored with exact TF-IDF cosine.
+
+Both backends take a query vector with the same columns as the candidate
+matrix and return candidate positions and scores, best first. Measure the accuracy trade-off with:
+
+    $ python -m anirecci.similarity --nprobe 4 8 16 --k 10
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+BACKENDS = ('exact', 'ivf')
+DEFAULT_BACKEND = os.environ.get('ANIRECCI_SIMILARITY_BACKEND', 'exact')
+N_COMPONENTS = 128
+N_PROBE = 8
+REFINE = 4
+KMEANS_ITERATIONS = 10
+# Rows assigned per step when clustering, to bound the dense score block.
+CHUNK_ROWS = 8192
+
+
+def top_k(scores, k):
+    """Positions and scores of the ``k`` largest finite scores, highest first."""
+    scores = np.asarray(scores)
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=scores.dtype)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return top, scores[top]
+
+
+def _normalize_rows(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return x / norms
+
+
+class ExactBackend:
+    name = 'exact'
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def scores(self, query):
+        # Rows are L2-normalised per block, so cosine is a single mat-vec.
+        return self.matrix @ query
+
+    def search(self, query, k):
+        return top_k(self.scores(query), k)
+
+
+class IVFBackend:
+    name = 'ivf'
+
+    def __init__(self, components, centroids, offsets, positions, embeddings,
+                 nprobe=N_PROBE, matrix=None, refine=REFINE):
+        self.components = components
+        self.centroids = centroids
+        self.offsets = offsets
+        self.positions = positions
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+        self.matrix = matrix
+        self.refine = refine
+
+    @classmethod
+    def build(cls, matrix, n_components=N_COMPONENTS, n_lists=None, nprobe=N_PROBE, refine=REFINE, seed=0):
+        n_rows, n_features = matrix.shape
+        n_components = max(1, min(n_components, n_features - 1, n_rows - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=seed)
+        embeddings = _normalize_rows(svd.fit_transform(matrix).astype(np.float32))
+        components = svd.components_.astype(np.float32)
+
+        n_lists = n_lists or max(1, int(np.sqrt(n_rows)))
+        centroids, assignment = _spherical_kmeans(embeddings, n_lists, seed)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        # Store rows grouped by list so each probe scans one contiguous block.
+        return cls(components, centroids, offsets, order.astype(np.int64), embeddings[order],
+                   nprobe=nprobe, matrix=matrix, refine=refine)
+
+    @classmethod
+    def load(cls, path, matrix=None, nprobe=N_PROBE, refine=REFINE):
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files},
+                       nprobe=nprobe, matrix=matrix, refine=refine)
+
+    def save(self, path):
+        np.savez(path, components=self.components, centroids=self.centroids, offsets=self.offsets,
+                 positions=self.positions, embeddings=self.embeddings)
+
+    def embed(self, query):
+        # Queries are mostly zeros; projecting only the non-zero columns avoids
+        # a full dense pass over the components matrix.
+        query = np.asarray(query, dtype=np.float32)
+        nonzero = np.flatnonzero(query)
+        vector = self.components[:, nonzero] @ query[nonzero]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def search(self, query, k):
+        vector = self.embed(query)
+        probes, _ = top_k(self.centroids @ vector, self.nprobe)
+        blocks = [np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes]
+        rows = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+        if self.matrix is None or not self.refine:
+            found, scores = top_k(self.embeddings[rows] @ vector, k)
+            return self.positions[rows[found]], scores
+        shortlist, _ = top_k(self.embeddings[rows] @ vector, k * self.refine)
+        positions = self.positions[rows[shortlist]]
+        found, scores = top_k(self.matrix[positions] @ query, k)
+        return positions[found], scores
+
+
+def _spherical_kmeans(embeddings, n_lists, seed):
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(embeddings))
+    centroids = embeddings[rng.choice(len(embeddings), n_lists, replace=False)].copy()
+    assignment = np.zeros(len(embeddings), dtype=np.int64)
+    for _ in range(KMEANS_ITERATIONS):
+        for start in range(0, len(embeddings), CHUNK_ROWS):
+            block = embeddings[start:start + CHUNK_ROWS]
+            assignment[start:start + CHUNK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, embeddings)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters from random rows rather than leaving them dead.
+        sums[empty] = embeddings[rng.choice(len(embeddings), int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+    return centroids, assignment
+
+
+def build_backend(name, matrix, cache_path=None, **params):
+    """Create backend ``name`` over ``matrix``, reusing an IVF index saved at ``cache_path``."""
+    if name == 'exact':
+        return ExactBackend(matrix)
+    if name == 'ivf':
+        nprobe = params.pop('nprobe', N_PROBE)
+        refine = params.pop('refine', REFINE)
+        if cache_path and os.path.exists(cache_path):
+            return IVFBackend.load(cache_path, matrix=matrix, nprobe=nprobe, refine=refine)
+        backend = IVFBackend.build(matrix, nprobe=nprobe, refine=refine, **params)
+        if cache_path:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp.npz"
+            backend.save(tmp_path)
+            os.replace(tmp_path, cache_path)
+        return backend
+    raise ValueError(f"Unknown similarity backend {name!r}; expected one of {BACKENDS}")
+
+
+def recall_at_k(exact, approximate, queries, k):
+    """Mean recall@k of ``approximate`` against ``exact``, plus mean query latency of each."""
+    recalls, exact_times, approx_times = [], [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        expected, _ = exact.search(query, k)
+        exact_times.append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        found, _ = approximate.search(query, k)
+        approx_times.append(time.perf_counter() - start_time)
+        if len(expected):
+            recalls.append(len(np.intersect1d(expected, found)) / len(expected))
+    return float(np.mean(recalls)), float(np.mean(exact_times)), float(np.mean(approx_times))
+
+
+def main(argv=None):
+    from anirecci.index import DEFAULT_CSV, load_index
+    from anirecci.recommender import Recommender
+
+    parser = argparse.ArgumentParser(description="Report ANN recall@k against exact similarity.")
+    parser.add_argument('csv_path', nargs='?', default=DEFAULT_CSV)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--components', type=int, default=N_COMPONENTS)
+    parser.add_argument('--lists', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[N_PROBE])
+    parser.add_argument('--refine', type=int, default=REFINE, help="exact re-scoring shortlist factor (0 disables)")
+    args = parser.parse_args(argv)
+
+    recommender = Recommender(load_index(args.csv_path), backend='exact')
+    matrix = recommender.candidate_matrix
+    catalog = recommender.index.catalog
+    rng = np.random.default_rng(0)
+    sample = rng.choice(recommender.candidate_rows, min(args.queries, len(recommender)), replace=False)
+    queries = [recommender.query_vector([catalog.iloc[row]]) for row in sample]
+
+    start_time = time.time()
+    ivf = IVFBackend.build(matrix, n_components=args.components, n_lists=args.lists, refine=args.refine)
+    print(f"Built IVF index over {matrix.shape[0]} rows in {time.time() - start_time:.2f} seconds "
+          f"({len(ivf.centroids)} lists, {ivf.embeddings.shape[1]} dims)")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        recall, exact_time, approx_time = recall_at_k(recommender.backend, ivf, queries, args.k)
+        print(f"nprobe={nprobe:<4} recall@{args.k}={recall:.3f} "
+              f"exact={exact_time * 1000:.2f}ms ivf={approx_time * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Cold-start support: deferred imports, a warm-up hook and readiness checks.
+
+Run the app through this module on autoscaled deployments:
+
+    $ python -m anirecci.startup --script streamlit_app.py --server.port 8501
+
+Arguments other than ``--script`` and ``--health-port`` are passed on to
+``streamlit run``.
+
+It serves ``/healthz``, ``/readyz`` and ``/metrics`` on ``ANIRECCI_METRICS_PORT``
+(8502 by default). The process is then warmed up on a background thread: the
+heavy modules are imported and the recommender and title resolver are loaded.
+Streamlit runs in the same process meanwhile. ``/readyz`` answers 503 until the
+warm-up has finished, so a load balancer only routes users to warm processes.
+
+Import and warm-up timings are recorded as ``import``/``warmup`` spans and
+reported in :data:`status`. A plain ``streamlit run`` warms up on the first
+page view instead.
+"""
+import argparse
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+
+from anirecci.metrics import metrics, serve_prometheus
+
+logger = logging.getLogger(__name__)
+
+PROCESS_START = time.time()
+DEFAULT_HEALTH_PORT = 8502
+# Imported during warm-up; everything the first recommendation needs.
+HEAVY_MODULES = (
+    'pandas',
+    'scipy.sparse',
+    'sklearn.feature_extraction.text',
+    'anirecci.recommender',
+    'anirecci.profile',
+    'anirecci.diversity',
+    'anirecci.live_index',
+    'anirecci.batch',
+    'anirecci.feedback',
+    'anirecci.resolver',
+    'anirecci.jikan',
+    'anirecci.result_cache',
+    'anirecci.thumbnails',
+)
+
+# Readiness and cold-start timings (seconds), shared with the health endpoint.
+status = {'ready': False, 'error': None, 'imports': None, 'warmup': None, 'ready_after': None}
+
+_lock = threading.RLock()
+_shared = {}
+_warmup_thread = None
+_server = None
+
+
+def shared(group, key, factory):
+    """Process-wide instance of ``group``, built by ``factory`` and rebuilt when ``key`` changes.
+
+    ``key`` may be a callable; it is evaluated again after a rebuild, for
+    factories that themselves change what the key observes.
+    """
+    current_key = key() if callable(key) else key
+    with _lock:
+        entry = _shared.get(group)
+        if entry is None or entry[0] != current_key:
+            value = factory()
+            entry = _shared[group] = (key() if callable(key) else current_key, value)
+        return entry[1]
+
+
+def current_recommender():
+    """Recommender over the newest live index generation, or the published CSV index.
+
+    Both indexes are memory-mapped, so every worker on the host shares one
+    copy. A new live generation, a newly published index or a changed CSV
+    swaps the recommender on the next call.
+    """
+    from anirecci.index import DEFAULT_CSV, current_generation, current_index, read_index
+    from anirecci.live_index import DEFAULT_LIVE_DIR, MANIFEST, current_snapshot
+    from anirecci.recommender import Recommender
+
+    if os.path.exists(os.path.join(DEFAULT_LIVE_DIR, MANIFEST)):
+        version, path = current_snapshot(DEFAULT_LIVE_DIR)
+        return shared('recommender', ('live', version), lambda: Recommender(read_index(path)))
+    # Workers only attach to CURRENT.json; current_index() publishes a rebuild, which bumps the generation.
+    return shared('recommender', lambda: ('csv', os.path.getmtime(DEFAULT_CSV), current_generation()[0]),
+                  lambda: Recommender(current_index(DEFAULT_CSV)))
+
+
+def title_resolver():
+    from anirecci.resolver import DEFAULT_CATALOG_CSV, TitleResolver
+
+    return shared('resolver', os.path.getmtime(DEFAULT_CATALOG_CSV), TitleResolver.from_csv)
+
+
+def warm_up():
+    """Import the heavy modules and load the shared resources, recording how long each step took."""
+    start_time = time.perf_counter()
+    try:
+        with metrics.span('warmup', phase='imports'):
+            for name in HEAVY_MODULES:
+                with metrics.span('import', module=name):
+                    importlib.import_module(name)
+        status['imports'] = time.perf_counter() - start_time
+        with metrics.span('warmup', phase='resources'):
+            current_recommender()
+            title_resolver()
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        status['error'] = repr(e)
+        return
+    status['warmup'] = time.perf_counter() - start_time
+    status['ready_after'] = time.time() - PROCESS_START
+    status['ready'] = True
+    logger.info("Warm-up finished in %.2fs (imports %.2fs), ready %.2fs after start",
+                status['warmup'], status['imports'], status['ready_after'])
+
+
+def start_warm_up():
+    """Run :func:`warm_up` once per process on a daemon thread."""
+    global _warmup_thread
+    with _lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name='anirecci-warmup', daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def health():
+    return {**status, 'uptime': time.time() - PROCESS_START}
+
+
+def serve_health(port):
+    """Start the health/metrics endpoint once per process."""
+    global _server
+    with _lock:
+        if _server is None:
+            _server = serve_prometheus(port, health=health)
+    return _server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Streamlit app with a warm-up hook and readiness checks.")
+    # An option rather than a positional, so a Streamlit flag's value is never taken for the script.
+    parser.add_argument('--script', default='streamlit_app.py')
+    parser.add_argument('--health-port', type=int,
+                        default=int(os.environ.get('ANIRECCI_METRICS_PORT', DEFAULT_HEALTH_PORT)))
+    args, streamlit_args = parser.parse_known_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    # The app starts its own endpoint from this variable; it reuses ours.
+    os.environ['ANIRECCI_METRICS_PORT'] = str(args.health_port)
+    serve_health(args.health_port)
+    start_warm_up()
+
+    from streamlit.web import cli as stcli
+
+    sys.argv = ['streamlit', 'run', args.script, *streamlit_args]
+    sys.exit(stcli.main())
+
+
+if __name__ == '__main__':
+    # Run the copy imported as anirecci.startup, so the app sees the same
+    # readiness state and shared resources as this launcher.
+    from anirecci.startup import main as startup_main
+    startup_main()
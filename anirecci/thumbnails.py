@@ -0,0 +1,222 @@
+"""Local, size-bounded store of card-sized cover thumbnails.
+
+Recommendation cards used to hand the MyAnimeList CDN URL straight to
+``st.image``, so every render pulled full-size JPEGs. Covers are now fetched
+once with bounded concurrency, resized to card-sized WebP (JPEG where Pillow
+has no WebP support) and stored content-addressed on disk:
+
+    artifacts/thumbnails/index.sqlite3       url -> digest, blob sizes and last access
+    artifacts/thumbnails/ab/abcdef....webp   thumbnail bytes, named by their SHA-256
+
+When the blobs exceed ``max_bytes`` the least recently served ones are
+evicted. Prefetch the whole catalog ahead of time with:
+
+    $ python -m anirecci.thumbnails raw_anime_data_paged.csv --workers 8
+
+Titles without a usable cover get a placeholder generated locally.
+"""
+import argparse
+import functools
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image, ImageDraw, features
+from requests.adapters import HTTPAdapter
+
+from anirecci.catalog import load_catalog
+from anirecci.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THUMB_DIR = os.path.join('artifacts', 'thumbnails')
+# Cards are drawn 120px wide; twice that keeps covers sharp on high-DPI screens.
+THUMB_SIZE = (240, 340)
+FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+QUALITY = 80
+MAX_BYTES = 256 * 1024 * 1024
+MAX_WORKERS = 8
+# Failed URLs are not retried until this many seconds have passed.
+FAILURE_TTL = 24 * 3600
+
+
+@functools.lru_cache(maxsize=None)
+def placeholder():
+    """Neutral cover for titles without an image, rendered once per process."""
+    image = Image.new('RGB', THUMB_SIZE, '#b4c8ea')
+    draw = ImageDraw.Draw(image)
+    draw.text((THUMB_SIZE[0] // 2, THUMB_SIZE[1] // 2), "No image", fill='white', anchor='mm')
+    return _encode(image)
+
+
+def _encode(image):
+    buffer = io.BytesIO()
+    image.save(buffer, FORMAT, quality=QUALITY)
+    return buffer.getvalue()
+
+
+def make_thumbnail(data):
+    """Card-sized thumbnail bytes for raw image ``data``, preserving the aspect ratio."""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGB')
+        image.thumbnail(THUMB_SIZE, Image.Resampling.LANCZOS)
+        return _encode(image)
+
+
+class ThumbnailStore:
+    """Content-addressed thumbnail blobs with an LRU size bound, shared by threads and processes."""
+
+    def __init__(self, path=DEFAULT_THUMB_DIR, max_bytes=MAX_BYTES, max_workers=MAX_WORKERS, timeout=10):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.evict_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY, digest TEXT, fetched_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS blobs (
+                    digest TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access);
+            """)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.path, 'index.sqlite3'), timeout=30)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, digest[:2], f"{digest}.{FORMAT.lower()}")
+
+    def get(self, url):
+        """Thumbnail bytes for ``url`` if stored, else ``None``."""
+        if not url:
+            return None
+        with self._connect() as conn:
+            row = conn.execute('SELECT digest FROM urls WHERE url = ?', (url,)).fetchone()
+            if row is None or row[0] is None:
+                return None
+            try:
+                with open(self._blob_path(row[0]), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+            conn.execute('UPDATE blobs SET last_access = ? WHERE digest = ?', (time.time(), row[0]))
+        return data
+
+    def _known(self, urls):
+        """URLs that are stored, or failed recently enough not to be retried."""
+        urls, known = list(urls), set()
+        with self._connect() as conn:
+            # Chunked to stay under SQLite's bound-parameter limit.
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT url FROM urls WHERE url IN ({','.join('?' * len(chunk))})"
+                    ' AND (digest IS NOT NULL OR fetched_at > ?)', (*chunk, time.time() - FAILURE_TTL))
+                known.update(row[0] for row in rows)
+        return known
+
+    def fetch(self, url):
+        """Download, resize and store one cover; returns its thumbnail bytes or ``None``."""
+        with metrics.span('fetch', source='thumbnails'):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                data = make_thumbnail(response.content)
+            except (requests.RequestException, OSError) as e:
+                logger.warning("Could not fetch cover %s: %s", url, e)
+                with self._connect() as conn:
+                    conn.execute('INSERT OR REPLACE INTO urls (url, digest, fetched_at) VALUES (?, NULL, ?)',
+                                 (url, time.time()))
+                return None
+
+        digest = hashlib.sha256(data).hexdigest()
+        target = self._blob_path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO blobs (digest, size, last_access) VALUES (?, ?, ?)',
+                         (digest, len(data), time.time()))
+            conn.execute('INSERT OR REPLACE INTO urls (url, digest, fetched_at) VALUES (?, ?, ?)',
+                         (url, digest, time.time()))
+        return data
+
+    def prefetch(self, urls):
+        """Fetch every URL not stored yet, ``max_workers`` at a time; returns the number fetched."""
+        urls = {url for url in urls if isinstance(url, str) and url}
+        pending = sorted(urls - self._known(urls))
+        if not pending:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fetched = sum(data is not None for data in executor.map(self.fetch, pending))
+        self.evict()
+        return fetched
+
+    def thumbnail(self, url):
+        """Bytes to show for ``url``: the stored thumbnail, fetched on first use, or the placeholder."""
+        data = self.get(url)
+        metrics.incr('thumbnails_miss' if data is None else 'thumbnails_hit')
+        if data is None and isinstance(url, str) and url and not self._known({url}):
+            data = self.fetch(url)
+        return data or placeholder()
+
+    def evict(self):
+        """Drop least recently served blobs until the store fits in ``max_bytes``; returns bytes freed."""
+        freed = 0
+        with self.evict_lock, self._connect() as conn:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            for digest, size in conn.execute('SELECT digest, size FROM blobs ORDER BY last_access').fetchall():
+                if total - freed <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                # Evicted covers are refetched on their next use.
+                conn.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+                freed += size
+        return freed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefetch cover thumbnails for the catalog.")
+    parser.add_argument('csv_paths', nargs='*', default=['raw_anime_data_paged.csv'])
+    parser.add_argument('--thumb-dir', default=DEFAULT_THUMB_DIR)
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--max-mb', type=int, default=MAX_BYTES // (1024 * 1024))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    start_time = time.time()
+    store = ThumbnailStore(args.thumb_dir, max_bytes=args.max_mb * 1024 * 1024, max_workers=args.workers)
+    urls = set()
+    for csv_path in args.csv_paths:
+        urls.update(load_catalog(csv_path, columns=['image_url'])['image_url'].dropna())
+    fetched = store.prefetch(urls)
+    print(f"Fetched {fetched} of {len(urls)} covers in {time.time() - start_time:.1f} seconds")
+
+
+if __name__ == '__main__':
+    main()
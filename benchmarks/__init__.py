@@ -0,0 +1,43 @@
+"""Benchmarks and load tests for AniRecci.
+
+* ``python -m benchmarks.jikan_stub`` - local stand-in for the Jikan API
+* ``python -m benchmarks.micro`` - parsing, index build and scoring microbenchmarks
+* ``python -m benchmarks.load`` - concurrent end-to-end load driver
+* ``python -m benchmarks.compare`` - diff two result files
+
+Results are written as JSON under ``artifacts/benchmarks/``, tagged with the
+current git commit.
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+
+RESULTS_DIR = os.path.join('artifacts', 'benchmarks')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def write_results(kind, results, output=None):
+    """Write ``results`` with run metadata; returns the file path."""
+    commit = git_commit()
+    output = output or os.path.join(RESULTS_DIR, f"{kind}-{commit}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'kind': kind,
+            'commit': commit,
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'results': results,
+        }, f, indent=2)
+    return output
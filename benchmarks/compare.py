@@ -0,0 +1,56 @@
+"""Compare two benchmark result files and flag regressions.
+
+    $ python -m benchmarks.compare artifacts/benchmarks/micro-abc123-*.json artifacts/benchmarks/micro-def456-*.json
+"""
+import argparse
+import json
+import sys
+
+
+def flatten(value, prefix=''):
+    """``{'a': {'p50_ms': 1}}`` -> ``{'a.p50_ms': 1}``, keeping numeric leaves only."""
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}{key}."))
+        return items
+    if isinstance(value, list):
+        items = {}
+        for i, child in enumerate(value):
+            key = child.get('size', i) if isinstance(child, dict) else i
+            items.update(flatten(child, f"{prefix}{key}."))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix.rstrip('.'): value}
+    return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative slowdown to flag")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    old, new = flatten(baseline['results']), flatten(candidate['results'])
+
+    print(f"{baseline['commit']} -> {candidate['commit']}")
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        if key.startswith('config.') or not key.endswith('_ms') or not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{key:<50} {old[key]:>10.2f} {new[key]:>10.2f} {change:>+8.1%}{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
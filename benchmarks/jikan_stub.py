@@ -0,0 +1,140 @@
+"""Local stand-in for the Jikan ``/v4/anime`` endpoint.
+
+Serves recorded responses from a JSON file mapping request paths (including
+the query string) to response bodies. Search and paging requests that were
+not recorded are answered from the local catalog CSV in Jikan's response
+shape, so the stub works without any recordings. Latency and 429 responses
+can be injected:
+
+    $ python -m benchmarks.jikan_stub --port 8900 --latency-ms 150 --error-rate 0.05
+
+Point the client at it with ``JikanClient(base_url='http://127.0.0.1:8900/v4')``.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from anirecci.catalog import load_catalog
+from anirecci.resolver import TitleResolver
+
+DEFAULT_CATALOG_CSV = 'raw_anime_data_paged.csv'
+PAGE_SIZE = 25
+
+
+def jikan_anime(row):
+    """A catalog row in the shape of a Jikan anime object."""
+    return {
+        'mal_id': int(row['id']),
+        'title': row['title'],
+        'genres': [{'name': name} for name in row['genres']],
+        'popularity': None if row['popularity'] != row['popularity'] else int(row['popularity']),
+        'score': None if row['rating'] != row['rating'] else float(row['rating']),
+        'synopsis': row['description'] if isinstance(row['description'], str) else None,
+        'images': {'jpg': {'image_url': row['image_url'] if isinstance(row['image_url'], str) else None}},
+    }
+
+
+class JikanStub:
+    def __init__(self, catalog_csv=DEFAULT_CATALOG_CSV, recordings=None, latency=0.0, jitter=0.0,
+                 error_rate=0.0, seed=0):
+        catalog = load_catalog(catalog_csv)
+        self.resolver = TitleResolver(catalog)
+        self.records = [jikan_anime(row) for row in catalog.to_dict('records')]
+        self.recordings = recordings or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def respond(self, path):
+        """``(status, body)`` for a request path, after the injected latency."""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            throttled = self.random.random() < self.error_rate
+            if throttled:
+                self.errors += 1
+        time.sleep(delay)
+        if throttled:
+            return 429, {'status': 429, 'type': 'RateLimitException', 'message': 'You are being rate limited'}
+        if path in self.recordings:
+            return 200, self.recordings[path]
+
+        url = urlparse(path)
+        if url.path.rstrip('/') != '/v4/anime':
+            return 404, {'status': 404, 'message': 'Not Found'}
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if 'q' in params:
+            row = self.resolver.lookup(params['q'])
+            return 200, {'data': [] if row is None else [self.records[row]]}
+
+        page = int(params.get('page', 1))
+        limit = int(params.get('limit', PAGE_SIZE))
+        records = self.records[::-1] if params.get('sort') == 'desc' else self.records
+        last_page = max(1, -(-len(records) // limit))
+        return 200, {
+            'data': records[(page - 1) * limit:page * limit],
+            'pagination': {'last_visible_page': last_page, 'has_next_page': page < last_page},
+        }
+
+
+def serve(stub, host='127.0.0.1', port=8900):
+    """Start the stub on a daemon thread; returns the running server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            status, body = stub.respond(self.path)
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', '1')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='jikan-stub', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Jikan API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--catalog-csv', default=DEFAULT_CATALOG_CSV)
+    parser.add_argument('--recordings', help="JSON file mapping request paths to response bodies")
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    args = parser.parse_args(argv)
+
+    recordings = None
+    if args.recordings:
+        with open(args.recordings) as f:
+            recordings = json.load(f)
+    stub = JikanStub(args.catalog_csv, recordings, args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate)
+    server = serve(stub, args.host, args.port)
+    print(f"Jikan stub listening on http://{args.host}:{server.server_port}/v4")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""End-to-end load driver.
+
+Simulates ``--users`` concurrent users, each issuing ``--requests`` recommendation
+requests through the same path the app uses: local title resolution, Jikan
+lookups for misses (against :mod:`benchmarks.jikan_stub` by default), then
+scoring. Reports throughput and latency percentiles per stage.
+
+    $ python -m benchmarks.load --users 32 --requests 20 --latency-ms 150 --error-rate 0.02
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from anirecci.catalog import load_catalog
+from anirecci.feedback import FeedbackModel
+from anirecci.index import DEFAULT_CSV, load_index
+from anirecci.jikan import JikanClient, RateLimiter, TokenBucket
+from anirecci.recommender import Recommender
+from anirecci.resolver import DEFAULT_CATALOG_CSV, TitleResolver, resolve_titles
+from benchmarks import write_results
+from benchmarks.jikan_stub import JikanStub, serve
+from benchmarks.micro import stats
+
+
+def user_session(user, args, titles, resolver, client, recommender, feedback, results, lock):
+    rng = random.Random(user)
+    for _ in range(args.requests):
+        seeds = rng.sample(titles, rng.randint(1, args.max_seeds))
+        start_time = time.perf_counter()
+        fetched = [anime for anime in resolve_titles(seeds, resolver, client) if anime]
+        fetched_time = time.perf_counter()
+        if fetched:
+            recommender.recommend(fetched, args.k, feedback=feedback)
+        end_time = time.perf_counter()
+        with lock:
+            results['fetch'].append(fetched_time - start_time)
+            results['score'].append(end_time - fetched_time)
+            results['total'].append(end_time - start_time)
+            results['resolved'] += len(fetched)
+            results['requested'] += len(seeds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive concurrent recommendation requests end to end.")
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=20, help="requests per user")
+    parser.add_argument('--max-seeds', type=int, default=5)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--miss-rate', type=float, default=0.2,
+                        help="fraction of catalog titles hidden from the local resolver, so they go to the API")
+    parser.add_argument('--backend', default='exact')
+    parser.add_argument('--base-url', help="Jikan URL to use instead of starting the local stub")
+    parser.add_argument('--latency-ms', type=float, default=100.0, help="stub latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="stub 429 rate")
+    parser.add_argument('--rate', type=float, default=1000.0, help="client requests per second")
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    catalog = load_catalog(DEFAULT_CATALOG_CSV)
+    catalog['description'] = catalog['description'].fillna("")
+    titles = catalog['title'].tolist()
+    # The stub knows every title; the local resolver only a sample of them.
+    resolver = TitleResolver(catalog.sample(frac=1 - args.miss_rate, random_state=0))
+    recommender = Recommender(load_index(DEFAULT_CSV), backend=args.backend)
+    feedback = FeedbackModel.load()
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        stub = JikanStub(DEFAULT_CATALOG_CSV, latency=args.latency_ms / 1000, error_rate=args.error_rate)
+        server = serve(stub, port=0)
+        base_url = f"http://127.0.0.1:{server.server_port}/v4"
+
+    with tempfile.TemporaryDirectory(prefix='anirecci-load-') as cache_dir:
+        client = JikanClient(cache_path=f"{cache_dir}/jikan.sqlite3", base_url=base_url,
+                             max_workers=args.max_seeds, rate_limiter=RateLimiter([TokenBucket(args.rate, 1.0)]))
+        results = {'fetch': [], 'score': [], 'total': [], 'resolved': 0, 'requested': 0}
+        lock = threading.Lock()
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as executor:
+            futures = [executor.submit(user_session, user, args, titles, resolver, client, recommender, feedback,
+                                       results, lock)
+                       for user in range(args.users)]
+        elapsed = time.perf_counter() - start_time
+    if server:
+        server.shutdown()
+    # A failed session would otherwise just show up as fewer requests.
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {args.users} user sessions failed") from errors[0]
+
+    summary = {
+        'config': vars(args),
+        'requests': len(results['total']),
+        'elapsed_s': elapsed,
+        'throughput_rps': len(results['total']) / elapsed,
+        'resolved_ratio': results['resolved'] / max(1, results['requested']),
+        'latency': {stage: stats(results[stage]) for stage in ('fetch', 'score', 'total') if results[stage]},
+    }
+    print(f"{summary['requests']} requests in {elapsed:.2f}s: {summary['throughput_rps']:.1f} req/s")
+    for stage, values in summary['latency'].items():
+        print(f"  {stage:<6} p50={values['p50_ms']:.1f}ms p95={values['p95_ms']:.1f}ms p99={values['p99_ms']:.1f}ms")
+    print(f"Results written to {write_results('load', summary, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Microbenchmarks over synthetic catalogs.
+
+Measures, per catalog size:
+
+* genre parsing - ``eval`` (the original app), ``ast.literal_eval`` and the Parquet catalog
+* index build - TF-IDF fit and write via :func:`anirecci.index.build_index`
+* scoring - single-request latency for each similarity backend, and batch throughput
+* profiles - latency of 50-seed requests for each aggregation in :mod:`anirecci.profile`
+
+    $ python -m benchmarks.micro --sizes 5000 50000 500000
+"""
+import argparse
+import ast
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from anirecci.catalog import convert, load_catalog
+from anirecci.index import build_index, read_index
+from anirecci.profile import AGGREGATIONS
+from anirecci.recommender import Recommender
+from benchmarks import write_results
+
+DEFAULT_SIZES = (5000, 50000, 500000)
+GENRES = ['Action', 'Adventure', 'Avant Garde', 'Award Winning', 'Boys Love', 'Comedy', 'Drama', 'Ecchi',
+          'Fantasy', 'Girls Love', 'Gourmet', 'Horror', 'Mystery', 'Romance', 'Sci-Fi', 'Slice of Life',
+          'Sports', 'Supernatural', 'Suspense']
+VOCABULARY_SIZE = 30000
+DESCRIPTION_WORDS = 80
+PROFILE_SEEDS = 50
+
+
+def synthetic_catalog(size, seed=0):
+    """Catalog frame with the CSV's columns and Zipf-distributed description words."""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(VOCABULARY_SIZE)])
+    tokens = (rng.zipf(1.2, size=(size, DESCRIPTION_WORDS)) - 1) % VOCABULARY_SIZE
+    genre_counts = rng.integers(0, 4, size=size)
+    return pd.DataFrame({
+        'id': np.arange(1, size + 1),
+        'title': [f"Title {i}" for i in range(1, size + 1)],
+        'genres': [str(rng.choice(GENRES, n, replace=False).tolist()) for n in genre_counts],
+        'popularity': rng.permutation(size) + 1,
+        'rating': np.round(rng.uniform(4, 9, size=size), 2),
+        'description': [' '.join(row) for row in words[tokens]],
+        'image_url': [f"https://cdn.example.com/images/{i}.jpg" for i in range(1, size + 1)],
+    })
+
+
+def timed(fn, repeat=1):
+    """Call ``fn`` ``repeat`` times; returns (last result, list of durations in seconds)."""
+    durations, result = [], None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start_time)
+    return result, durations
+
+
+def stats(durations):
+    values = np.array(durations)
+    return {
+        'n': len(values),
+        'mean_ms': float(values.mean() * 1000),
+        'p50_ms': float(np.percentile(values, 50) * 1000),
+        'p95_ms': float(np.percentile(values, 95) * 1000),
+        'p99_ms': float(np.percentile(values, 99) * 1000),
+    }
+
+
+def bench_size(size, work_dir, queries, repeat, backends):
+    csv_path = os.path.join(work_dir, f"catalog-{size}.csv")
+    synthetic_catalog(size).to_csv(csv_path, index=False)
+    results = {'size': size}
+
+    def parse(parser):
+        anime_df = pd.read_csv(csv_path)
+        anime_df['genres'] = anime_df['genres'].apply(parser)
+        return anime_df
+
+    _, durations = timed(lambda: parse(eval), repeat)
+    results['parse_eval'] = stats(durations)
+    _, durations = timed(lambda: parse(ast.literal_eval), repeat)
+    results['parse_literal_eval'] = stats(durations)
+    catalog_dir = os.path.join(work_dir, 'catalog')
+    _, durations = timed(lambda: convert(csv_path, catalog_dir), 1)
+    results['catalog_convert'] = stats(durations)
+    _, durations = timed(lambda: load_catalog(csv_path, catalog_dir), repeat)
+    results['parquet_load'] = stats(durations)
+
+    index_dir = os.path.join(work_dir, f"index-{size}")
+    path, durations = timed(lambda: build_index(csv_path, index_dir, catalog_dir=catalog_dir), 1)
+    results['index_build'] = stats(durations)
+    anime_index, durations = timed(lambda: read_index(path), repeat)
+    results['index_load'] = stats(durations)
+
+    rng = np.random.default_rng(1)
+    sample = rng.choice(len(anime_index.catalog), min(queries, len(anime_index.catalog)), replace=False)
+    seed_sets = [[anime_index.catalog.iloc[row]] for row in sample]
+    for backend in backends:
+        recommender, durations = timed(lambda: Recommender(anime_index, backend=backend), 1)
+        results[f"recommender_init_{backend}"] = stats(durations)
+        durations = [timed(lambda: recommender.recommend(seeds, 10))[1][0] for seeds in seed_sets]
+        results[f"recommend_{backend}"] = stats(durations)
+
+    recommender = Recommender(anime_index, backend='exact')
+    _, durations = timed(lambda: recommender.recommend_batch(seed_sets, 10), repeat)
+    results['recommend_batch'] = {**stats(durations), 'seed_sets': len(seed_sets),
+                                  'sets_per_second': len(seed_sets) / statistics.median(durations)}
+
+    profiles = [[anime_index.catalog.iloc[row] for row in rng.choice(len(anime_index.catalog), PROFILE_SEEDS)]
+                for _ in range(queries)]
+    for aggregation in ('centroid', *AGGREGATIONS):
+        durations = [timed(lambda: recommender.recommend(seeds, 10, aggregation=aggregation))[1][0]
+                     for seeds in profiles]
+        results[f"profile_{aggregation}"] = stats(durations)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run AniRecci microbenchmarks on synthetic catalogs.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--queries', type=int, default=200, help="single-request scoring samples per size")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backends', nargs='+', default=['exact', 'ivf'])
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='anirecci-bench-') as work_dir:
+        for size in args.sizes:
+            start_time = time.time()
+            results.append(bench_size(size, work_dir, args.queries, args.repeat, args.backends))
+            summary = ', '.join(f"{name}={value['p50_ms']:.1f}ms" for name, value in results[-1].items()
+                                if isinstance(value, dict))
+            print(f"size={size} ({time.time() - start_time:.1f}s): {summary}")
+    print(f"Results written to {write_results('micro', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,13 @@
+import io
+import os
 import streamlit as st
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import ast
-from sklearn.preprocessing import MultiLabelBinarizer
+
+from anirecci.analytics import load_summary
+
+# matplotlib is imported on first use, so opening the page doesn't pay for it
+def pyplot():
+    import matplotlib.pyplot as plt
+    return plt
 
 # Title of the app
 st.title("Deep Exploratory Data Analysis For Niche List")
@@ -11,105 +15,137 @@ st.title("Deep Exploratory Data Analysis For Niche List")
 # Upload CSV file
 uploaded_file = "less_popular_anime.csv"
 
+# Summaries are computed once per dataset version and shared by every session;
+# the mtime in the key picks up a refreshed CSV without a restart.
+@st.cache_resource(show_spinner="Summarising dataset...")
+def get_summary(path, mtime):
+    return load_summary(path)
+
+# The heatmap and pairplot take seconds to draw even from aggregates, so they
+# are rendered once per dataset version and served as PNG bytes afterwards.
+@st.cache_resource(show_spinner="Rendering figure...")
+def render_png(kind, path, mtime):
+    import seaborn as sns
+    plt = pyplot()
+    summary = get_summary(path, mtime)
+    if kind == 'heatmap':
+        fig, ax = plt.subplots(figsize=(16, 12))
+        sns.heatmap(
+            summary['correlation'],
+            annot=False,
+            cmap="coolwarm",
+            fmt=".2f",
+            cbar=True,
+            ax=ax
+        )
+        ax.set_title("Heatmap of Anime Features (Genres, Popularity, and Ratings)", fontsize=16)
+    else:
+        fig = sns.pairplot(summary['pairplot_sample']).figure
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
 if uploaded_file is not None:
-    # Read the data
-    data = pd.read_csv(uploaded_file)
-    for_Hm = data
+    mtime = os.path.getmtime(uploaded_file)
+    summary = get_summary(uploaded_file, mtime)
+    numeric_columns = summary['numeric_columns']
+    categorical_columns = summary['categorical_columns']
 
     # Display the first few rows of the dataframe
     st.subheader("Data Preview")
-    st.write(data.head())
+    st.write(summary['preview'])
 
     # Show basic statistics
     st.subheader("Basic Statistics")
-    st.write(data.describe())
+    st.write(summary['describe'])
 
     # Show data types
     st.subheader("Data Types")
-    st.write(data.dtypes)
+    st.write(summary['dtypes'])
 
     # Check for missing values
     st.subheader("Missing Values")
-    st.write(data.isnull().sum())
+    st.write(summary['missing'])
 
     # Visualizations
     st.subheader("Visualizations")
 
+    def plot_histogram(ax, column):
+        if column in summary['histograms']:
+            counts, edges = summary['histograms'][column]
+            ax.stairs(counts, edges, fill=True)
+        else:
+            counts = summary['value_counts'][column]
+            ax.bar(counts.index.astype(str), counts.to_numpy())
+            ax.tick_params(axis='x', labelrotation=90)
+        ax.set_xlabel(column)
+        ax.set_ylabel("Count")
+
+    def plot_kde(ax, column, scale=1.0):
+        grid, density = summary['kdes'][column]
+        ax.fill_between(grid, density * scale, alpha=0.3)
+        ax.plot(grid, density * scale)
+
     # Histogram
     if st.checkbox("Show Histogram"):
-        column = st.selectbox("Select column for histogram", data.columns)
-        fig, ax = plt.subplots()
-        sns.histplot(data[column], ax=ax)
+        column = st.selectbox("Select column for histogram", summary['columns'])
+        fig, ax = pyplot().subplots()
+        plot_histogram(ax, column)
         st.pyplot(fig)
 
     # Correlation heatmap
     if st.checkbox("Show Correlation Heatmap"):
-            # Ensure genres column exists and process it
-            if 'genres' in data.columns and 'popularity' in data.columns and 'rating' in data.columns:
-                data['genres'] = data['genres'].apply(ast.literal_eval)  # Convert string to list
-                mlb = MultiLabelBinarizer()
-                genres_encoded = pd.DataFrame(
-                    mlb.fit_transform(data['genres']),
-                    columns=mlb.classes_,
-                    index=data.index
-                )
-
-                # Fill missing ratings with the median
-                data['rating'].fillna(data['rating'].median(), inplace=True)
-
-                # Combine genres, popularity, and rating for correlation matrix
-                anime_features = pd.concat([genres_encoded, data[['popularity', 'rating']]], axis=1)
-
-                # Compute correlation matrix
-                correlation_matrix = anime_features.corr()
-
-                # Plot the heatmap
-                fig, ax = plt.subplots(figsize=(16, 12))
-                sns.heatmap(
-                    correlation_matrix,
-                    annot=False,
-                    cmap="coolwarm",
-                    fmt=".2f",
-                    cbar=True,
-                    ax=ax
-                )
-                ax.set_title("Heatmap of Anime Features (Genres, Popularity, and Ratings)", fontsize=16)
-                st.pyplot(fig)
+            if 'correlation' in summary:
+                st.image(render_png('heatmap', uploaded_file, mtime))
             else:
                 st.error("Required columns ('genres', 'popularity', 'rating') are missing in the dataset.")
 
-    # Pairplot
+    # Pairplot over a popularity-stratified sample rather than every row
     if st.checkbox("Show Pairplot"):
-        fig = sns.pairplot(data)
-        st.pyplot(fig)
+        st.caption(f"Stratified sample of {len(summary['pairplot_sample'])} titles")
+        st.image(render_png('pairplot', uploaded_file, mtime))
 
 # Categorical plots
     if st.checkbox("Show Categorical Plot"):
-        categorical_column = st.selectbox("Select categorical column", data.select_dtypes(include=['object']).columns)
-        numerical_column = st.selectbox("Select numerical column", data.select_dtypes(include=['float64', 'int64']).columns)
-        fig, ax = plt.subplots()
-        sns.boxplot(x=categorical_column, y=numerical_column, data=data, ax=ax)
+        categorical_column = st.selectbox("Select categorical column", categorical_columns)
+        numerical_column = st.selectbox("Select numerical column", numeric_columns)
+        stats = summary['boxplots'][categorical_column][numerical_column]
+        fig, ax = pyplot().subplots()
+        ax.bxp(stats, showfliers=True)
+        ax.tick_params(axis='x', labelrotation=90)
+        ax.set_xlabel(f"{categorical_column} (top {len(stats)})")
+        ax.set_ylabel(numerical_column)
         st.pyplot(fig)
 
     # Distribution plot
     if st.checkbox("Show Distribution Plot"):
-        column = st.selectbox("Select column for distribution plot", data.columns)
-        fig, ax = plt.subplots()
-        sns.kdeplot(data[column], ax=ax, fill=True)
+        column = st.selectbox("Select column for distribution plot", numeric_columns)
+        fig, ax = pyplot().subplots()
+        plot_kde(ax, column)
+        ax.set_xlabel(column)
+        ax.set_ylabel("Density")
         st.pyplot(fig)
 
     # Count plot for categorical data
     if st.checkbox("Show Count Plot"):
-        categorical_column = st.selectbox("Select categorical column for count plot", data.select_dtypes(include=['object']).columns)
-        fig, ax = plt.subplots()
-        sns.countplot(x=categorical_column, data=data, ax=ax)
+        categorical_column = st.selectbox("Select categorical column for count plot", categorical_columns)
+        counts = summary['value_counts'][categorical_column]
+        fig, ax = pyplot().subplots()
+        ax.bar(counts.index.astype(str), counts.to_numpy())
+        ax.tick_params(axis='x', labelrotation=90)
+        ax.set_xlabel(f"{categorical_column} (top {len(counts)})")
+        ax.set_ylabel("Count")
         st.pyplot(fig)
 
     # Add more analyses as needed
     if st.checkbox("Show Data Distribution"):
         st.subheader("Data Distribution")
-        for column in data.select_dtypes(include=['float64', 'int64']).columns:
+        for column in numeric_columns:
             st.write(f"Distribution for {column}")
-            fig, ax = plt.subplots()
-            sns.histplot(data[column], bins=30, kde=True, ax=ax)
-            st.pyplot(fig)
\ No newline at end of file
+            counts, edges = summary['histograms'][column]
+            fig, ax = pyplot().subplots()
+            plot_histogram(ax, column)
+            # Scale the density to the histogram's counts, as histplot(kde=True) does
+            plot_kde(ax, column, scale=counts.sum() * (edges[1] - edges[0]))
+            st.pyplot(fig)
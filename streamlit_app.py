@@ -1,68 +1,138 @@
+import os
+import uuid
 import streamlit as st
-import pandas as pd
-import requests
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import time
 
+from anirecci import startup
+from anirecci.metrics import metrics
+
+# Heavy modules (pandas, scikit-learn, the engine) are imported inside the
+# functions that need them, so the first page paints before they are loaded;
+# the warm-up in anirecci.startup usually has them imported by then.
 # Load external CSS file
 st.markdown('<style>' + open('style.css').read() + '</style>', unsafe_allow_html=True)
 
-# Function to fetch anime details
-def fetch_anime_details(title):
-    start_time = time.time()
-    try:
-        url = f"https://api.jikan.moe/v4/anime?q={title}&limit=1"
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json().get('data', [])
-            if data:
-                anime = data[0]
-                elapsed_time = time.time() - start_time
-                st.session_state.fetch_time += elapsed_time
-                return {
-                    'id': anime.get('mal_id'),
-                    'title': anime.get('title'),
-                    'genres': [genre['name'] for genre in anime.get('genres', [])],
-                    'description': anime.get('synopsis', ""),
-                    'rating': anime.get('score', 0),
-                    'image_url': anime.get('images', {}).get('jpg', {}).get('image_url')
-                }
-        else:
-            print(f"Error fetching details for '{title}': HTTP {response.status_code}")
-    except Exception as e:
-        print(f"Error fetching details for '{title}': {e}")
-    return None
+# Optional Prometheus and health endpoint, started once per process
+@st.cache_resource
+def start_metrics_server(port):
+    return startup.serve_health(port)
 
-# Function to recommend lesser-known anime
-def recommend_less_popular(fetched_anime, tfidf_vectorizer, tfidf_matrix, less_popular_anime, num_recommendations=5):
-    start_time = time.time()
-    fetched_descriptions = [anime['description'] for anime in fetched_anime if anime]
+# The index and title resolver are process-wide (see anirecci.startup), so a
+# warm-up run before the first session is reused here. The recommender
+# follows the newest live index generation, or the prebuilt CSV index.
+def current_recommender():
+    with st.spinner("Loading anime index..."):
+        return startup.current_recommender()
 
-    if not fetched_descriptions:
-        st.warning("No valid descriptions available for recommendations.")
-        return []
+# Precomputed neighbour table from `python -m anirecci.batch`, if one has been built.
+# Only the newest version is kept, so rewrites don't pile up in the cache.
+@st.cache_resource(max_entries=1)
+def get_neighbour_table(path, mtime):
+    from anirecci.batch import NeighbourTable
+    return NeighbourTable.load(path)
+
+def find_neighbour_table(recommender):
+    from anirecci.batch import DEFAULT_TABLE_PATH as path
+    if not os.path.exists(path):
+        return None
+    table = get_neighbour_table(path, os.path.getmtime(path))
+    # Ignore tables computed against an older version of the catalog
+    return table if table.csv_hash == recommender.index.csv_hash else None
+
+# Shared feedback log (written off the UI thread) and the background job that
+# folds it into the re-ranking model every few minutes
+@st.cache_resource
+def get_feedback_log():
+    from anirecci.feedback import FeedbackLog, start_periodic_fold
+    start_periodic_fold()
+    return FeedbackLog()
+
+@st.cache_resource(max_entries=1)
+def load_feedback_model(path, mtime):
+    from anirecci.feedback import FeedbackModel
+    return FeedbackModel.load(path)
+
+def get_feedback_model():
+    from anirecci.feedback import DEFAULT_MODEL_PATH as path, FeedbackModel
+    if not os.path.exists(path):
+        return FeedbackModel.empty()
+    return load_feedback_model(path, os.path.getmtime(path))
+
+# One Jikan client per process: pooled connections, shared rate limit and on-disk cache
+@st.cache_resource
+def get_jikan_client():
+    from anirecci.jikan import JikanClient
+    return JikanClient()
+
+# Ranked lists for seed sets seen before, in memory and shared on disk across processes
+@st.cache_resource
+def get_result_cache():
+    from anirecci.result_cache import ResultCache
+    return ResultCache()
 
-    fetched_features = tfidf_vectorizer.transform(fetched_descriptions).mean(axis=0).A1
-    similarity_scores = cosine_similarity(fetched_features.reshape(1, -1), tfidf_matrix)
+# Local thumbnail store, so cards never pull full-size covers from the CDN
+@st.cache_resource
+def get_thumbnail_store():
+    from anirecci.thumbnails import ThumbnailStore
+    return ThumbnailStore()
 
-    scores = [(i, similarity_scores[0, i]) for i in range(len(similarity_scores[0])) if i < len(less_popular_anime)]
-    scores = sorted(scores, key=lambda x: x[1], reverse=True)
+# Function to fetch anime details, resolving locally first and querying
+# Jikan concurrently only for titles missing from the catalog
+def fetch_anime_details(titles):
+    from anirecci.resolver import resolve_titles
+    with metrics.span('fetch_all', titles=len(titles)):
+        return resolve_titles(titles, startup.title_resolver(), get_jikan_client())
 
-    if len(scores) < num_recommendations:
-        num_recommendations = len(scores)
+# Ranked candidate ids and scores for the seeds, from the neighbour table when
+# every seed is a known title, otherwise scored live
+def rank_candidates(seeds, recommender, feedback, k):
+    import numpy as np
+    from anirecci.diversity import POOL
+    seed_ids = [anime['id'] for anime in seeds]
+    table = find_neighbour_table(recommender)
+    # The table merges per-seed neighbour lists by summing; multi-seed requests
+    # use it only with the old centroid scoring and are otherwise aggregated
+    # by the recommender's profile scorer.
+    if len(seed_ids) > 1 and recommender.aggregation != 'centroid':
+        table = None
+    # Diversification picks k from a longer shortlist, which the table must hold.
+    depth = k * POOL if recommender.diversity < 1 else k
+    precomputed = table.recommend(seed_ids, table.k) if table and depth <= table.k else None
+    if precomputed is not None:
+        ids, scores = precomputed
+        if len(feedback.ids):
+            scores = scores + recommender.weights['feedback'] * feedback.scores(seed_ids, ids)
+            order = np.argsort(-scores, kind='stable')
+            ids, scores = ids[order], scores[order]
+        positions = np.array([recommender.candidate_positions.get(int(i), -1) for i in ids[:depth]])
+        # Neighbours outside the current candidate set mean the table is out of step; score live instead.
+        if not len(positions) or (positions < 0).any():
+            precomputed = None
+    metrics.incr('neighbour_table_miss' if precomputed is None else 'neighbour_table_hit')
+    if precomputed is not None:
+        positions, scores = recommender.diversify(positions, scores[:depth], k)
+        return recommender.candidate_ids[positions], scores
+    rows, scores = recommender.recommend(seeds, k, feedback=feedback)
+    return recommender.index.catalog['id'].to_numpy()[rows], scores
 
-    recommendations = []
-    for i in scores[:num_recommendations]:
-        try:
-            recommendations.append(less_popular_anime.iloc[i[0]])
-        except IndexError:
-            continue
+# Function to recommend lesser-known anime. Results are always computed DEPTH
+# deep (see anirecci.result_cache) and cached per seed set, so the slider only slices them.
+def recommend_less_popular(fetched_anime, recommender, num_recommendations=5):
+    seeds = [anime for anime in fetched_anime if anime]
 
-    elapsed_time = time.time() - start_time
-    st.session_state.recommend_time += elapsed_time
+    if not any(anime['description'] or anime['genres'] for anime in seeds):
+        st.warning("No valid descriptions available for recommendations.")
+        return []
 
-    return recommendations
+    catalog = recommender.index.catalog
+    feedback = get_feedback_model()
+    version = (f"{recommender.index.csv_hash}:{recommender.backend.name}:{recommender.aggregation}:"
+               f"{recommender.diversity}:{feedback.version}")
+    ids, _ = get_result_cache().get_or_compute(
+        [anime['id'] for anime in seeds], num_recommendations, version,
+        lambda k: rank_candidates(seeds, recommender, feedback, k))
+    # Ids that are no longer candidates (e.g. cached under an older index) are dropped.
+    positions = [recommender.candidate_positions[int(i)] for i in ids if int(i) in recommender.candidate_positions]
+    return [catalog.iloc[row] for row in recommender.candidate_rows[positions]]
 
 def get_individual_feedback(recommendations):
     feedback = {}
@@ -71,15 +141,26 @@ def get_individual_feedback(recommendations):
         feedback[anime['id']] = thumbs
     return feedback
 
+# Store votes that are new or changed since the last rerun
+def record_feedback(individual_feedback):
+    votes = {}
+    for anime_id, rating in individual_feedback.items():
+        anime_id = int(anime_id)
+        if rating != "Select" and st.session_state.feedback.get(anime_id) != rating:
+            votes[anime_id] = 1 if rating == "👍" else -1
+            st.session_state.feedback[anime_id] = rating
+    if votes:
+        get_feedback_log().record(st.session_state.seed_ids, votes, session=st.session_state.session_id)
+    return votes
+
 # Main application
 if __name__ == "__main__":
     st.title("AniRecci - Discover Lesser-Known Anime 🌟")
 
     # Initialize session state for performance metrics
-    if 'fetch_time' not in st.session_state:
-        st.session_state.fetch_time = 0.0
-    if 'recommend_time' not in st.session_state:
-        st.session_state.recommend_time = 0.0
+    if os.environ.get('ANIRECCI_METRICS_PORT'):
+        start_metrics_server(int(os.environ['ANIRECCI_METRICS_PORT']))
+
     if 'feedback' not in st.session_state:
         st.session_state.feedback = {}
     if 'recommendations' not in st.session_state:
@@ -88,23 +169,13 @@ if __name__ == "__main__":
         st.session_state.user_input = ""
     if 'num_recommendations' not in st.session_state:
         st.session_state.num_recommendations = 5
-    if 'precision_k' not in st.session_state:
-        st.session_state.precision_k = 0.0
-    if 'total_feedback' not in st.session_state:
-        st.session_state.total_feedback = 0
-    if 'positive_feedback' not in st.session_state:
-        st.session_state.positive_feedback = 0
-
-    # Load and preprocess the dataset
-    anime_df = pd.read_csv('less_popular_anime.csv')
-    anime_df['description'] = anime_df['description'].fillna("No description available.")
-    anime_df['genres'] = anime_df['genres'].apply(lambda x: [g.lower() for g in eval(x)] if pd.notna(x) else [])
-    
-    tfidf_vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = tfidf_vectorizer.fit_transform(anime_df['description'])
-
-    threshold = anime_df["popularity"].quantile(0.5)
-    less_popular_anime = anime_df[anime_df["popularity"] > threshold]
+    if 'seed_ids' not in st.session_state:
+        st.session_state.seed_ids = []
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    # Without the anirecci.startup launcher, warm up while the user is typing
+    startup.start_warm_up()
 
     # User input section
     st.session_state.user_input = st.text_input("Enter your favorite anime titles (comma-separated):", st.session_state.user_input)
@@ -112,60 +183,76 @@ if __name__ == "__main__":
 
     # Colorful "Get Recommendations" Button
     if st.button("Get Recommendations"):
+        st.session_state.recommendations = []
         if st.session_state.user_input:
             titles = [title.strip() for title in st.session_state.user_input.split(',')]
-            fetched_anime = []
-            for title in titles:
-                anime_details = fetch_anime_details(title)
-                if anime_details:
-                    fetched_anime.append(anime_details)
+            fetched_anime = [anime for anime in fetch_anime_details(titles) if anime]
 
             if fetched_anime:
-                st.session_state.recommendations = recommend_less_popular(fetched_anime, tfidf_vectorizer, tfidf_matrix, less_popular_anime, st.session_state.num_recommendations)
-                if st.session_state.recommendations:
-                    st.write("### Here Are Some Lesser-Known Anime 🌸")
-
-                    # Display recommendations with colorful borders and hover effects
-                    cols = st.columns(len(st.session_state.recommendations))
-
-                    for col, anime in zip(cols, st.session_state.recommendations):
-                        with col:
-                            image_url = anime.get('image_url', "https://via.placeholder.com/120")
-                            st.image(image_url, width=120)
-                            st.markdown(f"""
-                            <div class='recommendation-card'>
-                                <h4>{anime['title']}</h4>
-                                <p><strong>Genres:</strong> {', '.join(anime['genres'])}</p>
-                                <p><strong>Rating:</strong> {anime['rating']:.1f}</p>
-                                <p><strong>Description:</strong> {anime['description'][:250]}...</p>
-                            </div>
-                            """, unsafe_allow_html=True)
-
-                    # Collect individual feedback
-                    individual_feedback = get_individual_feedback(st.session_state.recommendations)
-                    for anime_id, rating in individual_feedback.items():
-                        if rating == "👍":
-                            st.session_state.positive_feedback += 1
-                        if rating != "Select":
-                            st.session_state.total_feedback += 1
-
-                    # Calculate Precision@k
-                    if st.session_state.total_feedback > 0:
-                        st.session_state.precision_k = st.session_state.positive_feedback / st.session_state.total_feedback
-
-                    st.success(f"Thank you for your feedback! Precision@k: {st.session_state.precision_k:.2%}")
-                else:
+                from anirecci.result_cache import DEPTH
+                # Load the prebuilt TF-IDF index and the candidate tier it scores against
+                recommender = current_recommender()
+                with metrics.span('recommend'):
+                    st.session_state.recommendations = recommend_less_popular(
+                        fetched_anime, recommender, max(DEPTH, st.session_state.num_recommendations))
+                st.session_state.seed_ids = [anime['id'] for anime in fetched_anime]
+                if not st.session_state.recommendations:
                     st.error("No recommendations could be generated.")
             else:
                 st.warning("No anime details were fetched.")
         else:
             st.error("Please enter at least one anime title.")
 
-    # Display performance metrics
+    # Recommendations stay on screen across reruns so feedback can be collected;
+    # the slider slices the cached list
+    recommendations = st.session_state.recommendations[:st.session_state.num_recommendations]
+    if recommendations:
+        st.write("### Here Are Some Lesser-Known Anime 🌸")
+
+        # Display recommendations with colorful borders and hover effects
+        cols = st.columns(len(recommendations))
+
+        with metrics.span('render'):
+            # Covers not prefetched yet are fetched together before drawing
+            thumbnails = get_thumbnail_store()
+            thumbnails.prefetch(anime.get('image_url') for anime in recommendations)
+            for col, anime in zip(cols, recommendations):
+                with col:
+                    st.image(thumbnails.thumbnail(anime.get('image_url')), width=120)
+                    st.markdown(f"""
+                    <div class='recommendation-card'>
+                        <h4>{anime['title']}</h4>
+                        <p><strong>Genres:</strong> {', '.join(anime['genres'])}</p>
+                        <p><strong>Rating:</strong> {anime['rating']:.1f}</p>
+                        <p><strong>Description:</strong> {anime['description'][:250]}...</p>
+                    </div>
+                    """, unsafe_allow_html=True)
+
+        # Collect individual feedback and store it for everyone's model
+        individual_feedback = get_individual_feedback(recommendations)
+        if record_feedback(individual_feedback):
+            st.success("Thank you for your feedback!")
+
+    # Display performance metrics, aggregated across all sessions in this process
     st.write("### Performance Metrics")
-    st.write(f"Total time spent fetching anime details: {st.session_state.fetch_time:.2f} seconds")
-    st.write(f"Total time spent generating recommendations: {st.session_state.recommend_time:.2f} seconds")
-    st.write(f"Precision@k: {st.session_state.precision_k:.2%}")
+    summary = metrics.summary()
+    if summary['stages']:
+        import pandas as pd
+        stages = pd.DataFrame.from_dict(summary['stages'], orient='index')
+        st.dataframe(stages[['count', 'p50', 'p95', 'p99']].mul([1, 1000, 1000, 1000]).rename(
+            columns={'p50': 'p50 (ms)', 'p95': 'p95 (ms)', 'p99': 'p99 (ms)'}))
+    for name in ('resolver', 'jikan_cache', 'result_cache', 'neighbour_table', 'thumbnails'):
+        hit_rate = metrics.hit_rate(name)
+        if hit_rate is not None:
+            st.write(f"{name.replace('_', ' ').capitalize()} hit rate: {hit_rate:.0%}")
+    # Cold-start timings of this process
+    if startup.status['ready']:
+        st.write(f"Warm-up: {startup.status['warmup']:.2f}s (imports {startup.status['imports']:.2f}s), "
+                 f"ready {startup.status['ready_after']:.2f}s after start")
+    # Precision@k over every user's stored feedback, as of the last fold
+    precision_k = get_feedback_model().precision
+    if precision_k is not None:
+        st.write(f"Precision@k: {precision_k:.2%}")
 
     # Display feedback section
     if st.session_state.feedback: